@@ -1,29 +1,105 @@
+import re
 import json
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
 import utils # Importa o utils para pegar o cliente
+import cache_llm
+import metricas
+import limitador
+import contexto
 from google import genai
 
 # Modelo de texto padrão (usando o Flash 1.5 ou 2.0 que é estável)
 MODELO_TEXTO = "gemini-1.5-flash" 
 
-def _gerar_texto(prompt, json_mode=False):
-    """Função auxiliar para chamar a nova API"""
-    client = utils.get_google_client()
-    if not client: return "Erro: API Key inválida."
-    
+def _gerar_texto(prompt, json_mode=False, agente=None, schema=None):
+    """Função auxiliar para chamar a nova API (com cache opcional por agente)"""
     config = {}
     if json_mode:
         config['response_mime_type'] = 'application/json'
+    if schema:
+        config['response_schema'] = schema
 
-    try:
-        response = client.models.generate_content(
-            model=MODELO_TEXTO,
-            contents=prompt,
-            config=config
-        )
-        return response.text
-    except Exception as e:
-        return f"Erro na geração: {e}"
+    with metricas.span("gerar_texto", agente=agente, modelo=MODELO_TEXTO, chars_prompt=len(prompt)) as m:
+        usar_cache = cache_llm.habilitado(agente)
+        if usar_cache:
+            chave = cache_llm.chave_resposta(MODELO_TEXTO, prompt, config)
+            em_cache = cache_llm.buscar(chave)
+            m["cache"] = em_cache is not None
+            if em_cache is not None: return em_cache
+
+        client = utils.get_google_client()
+        if not client:
+            m["erro"] = "API Key inválida"
+            return "Erro: API Key inválida."
+
+        try:
+            # Passa pelo limitador compartilhado (refaz 429/5xx com backoff)
+            response = limitador.obter("texto", MODELO_TEXTO).executar(
+                client.models.generate_content,
+                model=MODELO_TEXTO,
+                contents=prompt,
+                config=config
+            )
+            m.update(metricas.uso_tokens(response))
+            texto = response.text
+            if not texto:
+                # Resposta bloqueada (safety) ou vazia: vira erro como as exceções
+                m["erro"] = "resposta vazia"
+                return "Erro na geração: resposta vazia (bloqueada pelo filtro de segurança?)"
+            # Só guarda respostas válidas (erros nunca vão para o cache)
+            if usar_cache: cache_llm.gravar(chave, texto, agente)
+            return texto
+        except Exception as e:
+            m["erro"] = str(e)
+            return f"Erro na geração: {e}"
+
+def _gerar_texto_stream(prompt, agente=None):
+    """Versão em streaming do _gerar_texto: gera os pedaços de texto conforme chegam"""
+    config = {}
+    inicio = time.perf_counter()
+    with metricas.span("gerar_texto_stream", agente=agente, modelo=MODELO_TEXTO, chars_prompt=len(prompt)) as m:
+        usar_cache = cache_llm.habilitado(agente)
+        if usar_cache:
+            chave = cache_llm.chave_resposta(MODELO_TEXTO, prompt, config)
+            em_cache = cache_llm.buscar(chave)
+            m["cache"] = em_cache is not None
+            if em_cache is not None:
+                yield em_cache
+                return
+
+        client = utils.get_google_client()
+        if not client:
+            m["erro"] = "API Key inválida"
+            yield "Erro: API Key inválida."
+            return
+
+        def abrir_stream():
+            # Só dá para refazer antes do primeiro pedaço chegar
+            iterador = iter(client.models.generate_content_stream(
+                model=MODELO_TEXTO,
+                contents=prompt,
+                config=config
+            ))
+            return next(iterador, None), iterador
+
+        partes = []
+        try:
+            primeiro, iterador = limitador.obter("texto", MODELO_TEXTO).executar(abrir_stream)
+            for chunk in itertools.chain([primeiro] if primeiro else [], iterador):
+                # O uso de tokens vem acumulado no último pedaço
+                m.update(metricas.uso_tokens(chunk))
+                if chunk.text:
+                    if not partes: m["primeiro_pedaco_s"] = round(time.perf_counter() - inicio, 3)
+                    partes.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            m["erro"] = str(e)
+            yield f"Erro na geração: {e}"
+            return
+        if usar_cache and partes: cache_llm.gravar(chave, "".join(partes), agente)
 
 # --- 1. SINOPSE ---
 def agente_sinopse(tema, nicho, generos):
@@ -35,7 +111,7 @@ def agente_sinopse(tema, nicho, generos):
     Constraint: The story must have a clear beginning, middle, twist, and end.
     Output: Just the English synopsis text.
     """
-    return _gerar_texto(prompt)
+    return _gerar_texto(prompt, agente="sinopse")
 
 # --- 2. PLANEJADOR ---
 def agente_planejador(sinopse, generos):
@@ -48,13 +124,13 @@ def agente_planejador(sinopse, generos):
     Return ONLY the JSON string.
     """
     try:
-        texto_json = _gerar_texto(prompt, json_mode=True)
+        texto_json = _gerar_texto(prompt, json_mode=True, agente="planejador")
         return json.loads(texto_json)
     except:
         return [{"title": f"Chapter {i}", "events": "Continue story."} for i in range(1,9)]
 
 # --- 3. ESCRITOR ---
-def agente_escreve_capitulo_v2(titulo, eventos_capitulo, sinopse, resumo_anterior, generos):
+def agente_escreve_capitulo_v2(titulo, eventos_capitulo, sinopse, resumo_anterior, generos, stream=False):
     prompt = f"""
     ROLE: Chapter Writer.
     SYNOPSIS: "{sinopse}"
@@ -63,48 +139,315 @@ def agente_escreve_capitulo_v2(titulo, eventos_capitulo, sinopse, resumo_anterio
     PREVIOUS CONTEXT: {resumo_anterior}
     INSTRUCTIONS: Tone {generos}. Length 400-500 words. English. Narrative style.
     """
-    return _gerar_texto(prompt)
+    if stream: return _gerar_texto_stream(prompt, agente="escritor")
+    return _gerar_texto(prompt, agente="escritor")
+
+# --- 4. AUXILIARES (RESUMO + VISUAL NUMA CHAMADA SÓ) ---
+PROMPTS_POR_CAPITULO = 5
+TENTATIVAS_JSON = 3
+TIPOS_PLANO = ["establishing", "wide", "medium", "close-up", "detail"]
+ESTILO_VISUAL = "photorealistic, 8k, raw photography, 35mm film grain, cinematic lighting, detailed skin, dirt and dust"
+PROMPT_VISUAL_PADRAO = "Cinematic dark scene, photorealistic, 8k"
 
-# --- 4. AUXILIARES ---
-def agente_resumidor(texto_capitulo):
-    return _gerar_texto(f"Summarize this in 3 sentences (English): {texto_capitulo}")
+def _schema_capitulo(n):
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "summary": {"type": "STRING"},
+            "image_prompts": {
+                "type": "ARRAY", "min_items": n, "max_items": n,
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "shot": {"type": "STRING", "enum": TIPOS_PLANO},
+                        "subject": {"type": "STRING"},
+                        "setting": {"type": "STRING"},
+                        "lighting": {"type": "STRING"},
+                    },
+                    "required": ["shot", "subject", "setting", "lighting"],
+                },
+            },
+        },
+        "required": ["summary", "image_prompts"],
+    }
 
-def agente_visual(texto_capitulo):
-    # Prompt Visual Refinado (Realismo)
+def validar_capitulo(dados, n):
+    """Devolve (resumo, prompts) se a saída obedece ao schema; senão levanta ValueError."""
+    if not isinstance(dados, dict): raise ValueError("saída não é um objeto JSON")
+    resumo = dados.get("summary")
+    if not isinstance(resumo, str) or not resumo.strip(): raise ValueError("summary vazio")
+    cenas = dados.get("image_prompts")
+    if not isinstance(cenas, list) or len(cenas) != n:
+        raise ValueError(f"esperava {n} image_prompts, veio {len(cenas) if isinstance(cenas, list) else 0}")
+    prompts = []
+    for cena in cenas:
+        campos = [cena.get(c) for c in ("subject", "setting", "lighting")] if isinstance(cena, dict) else []
+        if not campos or not all(isinstance(c, str) and c.strip() for c in campos):
+            raise ValueError(f"cena incompleta: {cena}")
+        plano = cena.get("shot") if cena.get("shot") in TIPOS_PLANO else "medium"
+        prompts.append(f"{plano.capitalize()} shot of {campos[0].strip()}, {campos[1].strip()}, {campos[2].strip()}, {ESTILO_VISUAL}")
+    return resumo.strip(), prompts
+
+def agente_capitulo_estruturado(texto_capitulo, n_prompts=PROMPTS_POR_CAPITULO):
+    """
+    Uma chamada JSON por capítulo: resumo (contexto do próximo) + exatamente
+    n_prompts prompts de imagem tipados. Saída inválida é pedida de novo.
+    Retorna (resumo, prompts).
+    """
     prompt = f"""
     Read this story chapter:
     "{texto_capitulo}"
-    
-    Task: Create 5 distinct image prompts.
-    CRITICAL VISUAL STYLE:
-    - PHOTREALISTIC, 8k resolution, Raw Photography style.
-    - FILM LOOK: 35mm film grain, cinematic lighting.
-    - TEXTURE: Detailed skin, dirt, dust.
-    - NEGATIVE PROMPT: 3d render, cartoon, smooth skin, anime.
-    
-    Output: Return ONLY the 5 prompts separated by a pipe symbol (|).
+
+    Task 1 (summary): Summarize it in 3 sentences (English).
+    Task 2 (image_prompts): Describe exactly {n_prompts} distinct scenes for PHOTOREALISTIC film stills.
+    For each scene give: shot ({", ".join(TIPOS_PLANO)}), subject, setting, lighting.
+    Never describe 3d renders, cartoons, anime or smooth skin.
+    Return ONLY JSON: {{"summary": "...", "image_prompts": [{{"shot": "...", "subject": "...", "setting": "...", "lighting": "..."}}]}}
+    """
+    schema = _schema_capitulo(n_prompts)
+    erro = None
+    for tentativa in range(TENTATIVAS_JSON):
+        pedido = prompt if not erro else f"{prompt}\n    Your previous answer was invalid ({erro}). Follow the format exactly."
+        resposta = _gerar_texto(pedido, json_mode=True, agente="capitulo", schema=schema)
+        try:
+            return validar_capitulo(json.loads(resposta), n_prompts)
+        except (TypeError, ValueError) as e:  # JSONDecodeError também é ValueError
+            erro = str(e)
+            print(f"Saída do capítulo inválida (tentativa {tentativa + 1}/{TENTATIVAS_JSON}): {erro}")
+    return " ".join(texto_capitulo.split()[:60]), [PROMPT_VISUAL_PADRAO] * n_prompts
+
+# --- ORQUESTRADOR (PIPELINE DE CAPÍTULOS) ---
+def escrever_capitulos_pipeline(plano, sinopse, generos, ao_progredir=None, consumir_stream=None, contexto=None):
+    """
+    Escreve os capítulos do plano em sequência.
+    Depois de cada capítulo, uma única chamada JSON devolve o resumo (contexto
+    do próximo) e os prompts visuais; o capítulo N+1 começa quando ela volta.
+    `ao_progredir(i, total, titulo)` é chamado na thread principal (seguro p/ Streamlit).
+    Se `consumir_stream` for passado (ex: st.write_stream), o texto de cada capítulo
+    chega em streaming e ele deve devolver o texto completo.
+    Com `contexto` (contexto.ContextoHistoria), o escritor recebe o contexto rolante
+    com orçamento de tokens em vez da sinopse inteira + todos os resumos.
+    Retorna (texto_full, prompts, resumo) — mesmo resultado do loop sequencial.
+    """
+    texto_full = ""
+    resumo = "Start."
+    prompts = []
+
+    for i, cap in enumerate(plano):
+        tit = cap.get('title', f"Ch {i}")
+        evt = cap.get('events', '')
+        if ao_progredir: ao_progredir(i, len(plano), tit)
+
+        sinopse_cap, contexto_cap = sinopse, resumo
+        if contexto:
+            sinopse_cap, contexto_cap = contexto.sinopse_compacta, contexto.texto()
+            contexto.registrar_prompt(sinopse_cap, contexto_cap, tit, evt)
+
+        if consumir_stream:
+            txt = consumir_stream(agente_escreve_capitulo_v2(tit, evt, sinopse_cap, contexto_cap, generos, stream=True))
+        else:
+            txt = agente_escreve_capitulo_v2(tit, evt, sinopse_cap, contexto_cap, generos)
+        texto_full += f"\n\n## {tit}\n\n{txt}"
+        # Resumo e prompts visuais saem da mesma chamada, que bloqueia o próximo capítulo
+        resumo_cap, prompts_cap = agente_capitulo_estruturado(txt)
+        prompts.extend(prompts_cap)
+        resumo += f"\n{resumo_cap}"
+        if contexto: contexto.adicionar(tit, resumo_cap)
+
+    if ao_progredir: ao_progredir(len(plano), len(plano), "")
+    return texto_full, prompts, resumo
+
+# --- ORQUESTRADOR (CAPÍTULOS EM PARALELO + CONTINUIDADE) ---
+TRECHO_CONTINUIDADE = 700  # caracteres de cada lado da emenda entre capítulos
+
+def _contexto_do_plano(plano, i):
+    """Contexto de um capítulo vindo só do plano (não espera os vizinhos serem escritos)."""
+    antes = " ".join(f"[{c.get('title', '')}] {c.get('events', '')}" for c in plano[:i]) or "This is the first chapter."
+    depois = plano[i + 1] if i + 1 < len(plano) else None
+    proximo = f"[{depois.get('title', '')}] {depois.get('events', '')}" if depois else "This is the final chapter."
+    return f"Chapter {i + 1} of {len(plano)}. EARLIER (plan): {antes}\nNEXT CHAPTER (plan, do not write it): {proximo}"
+
+def _dividir_abertura(texto):
+    """Separa o 1º parágrafo (ou os primeiros, até ~TRECHO_CONTINUIDADE) do resto do capítulo."""
+    paragrafos = texto.split("\n\n")
+    n = 1
+    while n < len(paragrafos) and len("\n\n".join(paragrafos[:n])) < TRECHO_CONTINUIDADE // 2:
+        n += 1
+    return "\n\n".join(paragrafos[:n]), "\n\n".join(paragrafos[n:])
+
+def agente_continuidade(final_anterior, texto_capitulo, sinopse):
+    """
+    Passo leve de continuidade numa emenda: reescreve só a abertura do capítulo
+    para ligar com o final do anterior e corrige nomes trocados no capítulo todo.
+    Retorna (texto_corrigido, renomeacoes).
+    """
+    abertura, resto = _dividir_abertura(texto_capitulo)
+    prompt = f"""
+    Role: Continuity Editor.
+    SYNOPSIS (canonical names): "{sinopse}"
+    END OF PREVIOUS CHAPTER: "...{final_anterior[-TRECHO_CONTINUIDADE:]}"
+    OPENING OF THIS CHAPTER: "{abertura}"
+    Task: Fix the hand-off so the opening follows naturally from the previous ending
+    (time, place, who is present). Keep its length and tone. Also list character or
+    place names in the opening that contradict the synopsis or the previous chapter.
+    Return ONLY JSON: {{"opening": "...", "renames": {{"WrongName": "RightName"}}}}
     """
     try:
-        resp = _gerar_texto(prompt)
-        prompts = resp.split('|')
-        return [p.strip() for p in prompts if p.strip()]
-    except:
-        return ["Cinematic dark scene, photorealistic, 8k"] * 5
+        dados = json.loads(_gerar_texto(prompt, json_mode=True, agente="continuidade"))
+    except (TypeError, ValueError):  # Resposta None ou JSON inválido
+        return texto_capitulo, {}
+    if not isinstance(dados, dict): return texto_capitulo, {}  # Lista/string em vez de objeto
+    nova_abertura = dados.get("opening", "")
+    renomeacoes = dados.get("renames") or {}
+    if not isinstance(renomeacoes, dict): renomeacoes = {}
+
+    # Abertura vazia ou desproporcional = resposta ruim, mantém a original
+    if not isinstance(nova_abertura, str) or not (0 < len(nova_abertura) < 3 * len(abertura) + 200):
+        nova_abertura = abertura
+    texto = f"{nova_abertura.strip()}\n\n{resto}" if resto else nova_abertura.strip()
+    renomeacoes = {
+        errado.strip(): certo.strip() for errado, certo in renomeacoes.items()
+        if isinstance(errado, str) and isinstance(certo, str) and errado.strip() and certo.strip() and errado.strip() != certo.strip()
+    }
+    for errado, certo in renomeacoes.items():
+        # Função como substituto: o nome vindo do modelo não é interpretado como template
+        texto = re.sub(rf"\b{re.escape(errado)}\b", lambda _, certo=certo: certo, texto)
+    return texto, renomeacoes
+
+def escrever_capitulos_paralelo(plano, sinopse, generos, ao_progredir=None, contexto=None, max_workers=4):
+    """
+    Modo fan-out: todos os capítulos são escritos ao mesmo tempo, cada um com
+    os eventos do plano como contexto (sem esperar o resumo do anterior).
+    Depois, um passo de continuidade ajusta as emendas entre capítulos vizinhos.
+    `ao_progredir(concluidos, total, titulo)` é chamado na thread principal.
+    Retorna (texto_full, prompts, resumo), como escrever_capitulos_pipeline.
+    """
+    titulos = [cap.get('title', f"Ch {i}") for i, cap in enumerate(plano)]
+    sinopse_cap = contexto.sinopse_compacta if contexto else sinopse
+
+    def escrever(i):
+        contexto_cap = _contexto_do_plano(plano, i)
+        txt = agente_escreve_capitulo_v2(titulos[i], plano[i].get('events', ''), sinopse_cap, contexto_cap, generos)
+        return txt, contexto_cap
 
-def agente_tradutor(texto_en):
-    return _gerar_texto(f"Traduza para PT-BR mantendo a formatação Markdown (## Titulos):\n{texto_en}")
+    textos, contextos = [None] * len(plano), [None] * len(plano)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {executor.submit(metricas.propagar(escrever), i): i for i in range(len(plano))}
+        for concluidos, futuro in enumerate(as_completed(futuros), 1):
+            i = futuros[futuro]
+            textos[i], contextos[i] = futuro.result()
+            if ao_progredir: ao_progredir(concluidos, len(plano) * 2, titulos[i])
+
+        # Continuidade: cada emenda (N-1 → N) é independente das outras
+        emendas = {
+            executor.submit(metricas.propagar(agente_continuidade), textos[i - 1], textos[i], sinopse_cap): i
+            for i in range(1, len(plano))
+        }
+        for futuro in as_completed(emendas):
+            i = emendas[futuro]
+            textos[i], renomeacoes = futuro.result()
+            if renomeacoes: print(f"Continuidade em {titulos[i]}: {renomeacoes}")
+
+        # Resumo + prompts visuais do texto já corrigido
+        estruturados = list(executor.map(metricas.propagar(agente_capitulo_estruturado), textos))
+
+    if contexto:
+        for i, (resumo_cap, _) in enumerate(estruturados):
+            contexto.registrar_prompt(sinopse_cap, contextos[i], titulos[i], plano[i].get('events', ''))
+            contexto.adicionar(titulos[i], resumo_cap)
+
+    texto_full = "".join(f"\n\n## {tit}\n\n{txt}" for tit, txt in zip(titulos, textos))
+    prompts = [p for _, prompts_cap in estruturados for p in prompts_cap]
+    resumo = "Start." + "".join(f"\n{resumo_cap}" for resumo_cap, _ in estruturados)
+    if ao_progredir: ao_progredir(len(plano) * 2, len(plano) * 2, "")
+    return texto_full, prompts, resumo
+
+MODOS_ESCRITA = {"sequencial": escrever_capitulos_pipeline, "paralelo": escrever_capitulos_paralelo}
+
+def gerar_rascunho(tema, nicho, generos, ao_progredir=None, modo="sequencial", orcamento_contexto=None):
+    """
+    Cadeia completa do rascunho: sinopse → plano → capítulos → tradução.
+    `modo` escolhe o orquestrador dos capítulos (ver MODOS_ESCRITA).
+    Com `orcamento_contexto` (tokens), o escritor usa o contexto rolante (contexto.ContextoHistoria).
+    `ao_progredir(fracao, mensagem)` é opcional. Retorna um dict no formato do session_state.
+    """
+    avisar = ao_progredir or (lambda fracao, mensagem: None)
+    avisar(0.02, "Sinopse...")
+    sinopse = agente_sinopse(tema, nicho, generos)
+    avisar(0.05, "Planejando capítulos...")
+    plano = agente_planejador(sinopse, generos)
+
+    def progresso_capitulos(i, total, tit):
+        avisar(0.05 + 0.8 * (i / total if total else 1), f"Escrevendo {tit}..." if tit else "Capítulos prontos")
+
+    ctx = contexto.ContextoHistoria(sinopse, orcamento_contexto) if orcamento_contexto else None
+    with metricas.estagio("capitulos"):
+        texto_full, prompts, _ = MODOS_ESCRITA[modo](plano, sinopse, generos, ao_progredir=progresso_capitulos, contexto=ctx)
+    avisar(0.9, "Traduzindo...")
+    with metricas.estagio("traducao"):
+        texto_pt, falhas_traducao = agente_tradutor(texto_full)
+    return {
+        "tema_atual": tema, "generos_str": generos, "nicho": nicho,
+        "sinopse_en": sinopse, "texto_completo_en": texto_full,
+        "texto_completo_pt": texto_pt, "prompts_visuais": prompts,
+        "capitulos_sem_traducao": falhas_traducao,
+        "tamanhos_contexto": ctx.relatorio() if ctx else None,
+    }
+
+def _traduzir_secao(secao):
+    """
+    Traduz uma seção '## ' reaproveitando a tradução se o trecho original não mudou.
+    Retorna (texto, ok); se falhar, devolve o original com ok=False.
+    """
+    if not secao.strip(): return secao, True
+    usar_cache = cache_llm.CONFIG["traducoes"]
+    chave = cache_llm.chave_traducao(MODELO_TEXTO, secao)
+    traducao = cache_llm.buscar(chave) if usar_cache else None
+    if traducao is None:
+        traducao = _gerar_texto(f"Traduza para PT-BR mantendo a formatação Markdown (## Titulos):\n{secao.strip()}", agente="tradutor")
+        if not isinstance(traducao, str) or not traducao.strip() or traducao.startswith("Erro"):
+            print(f"Tradução falhou: {traducao!r}")
+            return secao, False
+        if usar_cache: cache_llm.gravar(chave, traducao, "tradutor")
+    # Mantém o espaçamento original entre capítulos
+    inicio = secao[:len(secao) - len(secao.lstrip())]
+    fim = secao[len(secao.rstrip()):]
+    return inicio + traducao.strip() + fim, True
+
+def agente_tradutor(texto_en, max_workers=4):
+    """
+    Traduz capítulo a capítulo, em paralelo, e remonta na ordem original.
+    Retorna (texto_pt, falhas): `falhas` são os índices dos capítulos que
+    ficaram em inglês (a chamada falhou mesmo após as retentativas do limitador).
+    """
+    secoes = utils.dividir_capitulos(texto_en)
+    if not secoes: return "", []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = list(executor.map(metricas.propagar(_traduzir_secao), secoes))
+    return "".join(t for t, _ in resultados), [i for i, (_, ok) in enumerate(resultados) if not ok]
+
+def retraduzir_capitulos(texto_pt, texto_en, indices):
+    """Traduz de novo só os capítulos `indices` e os encaixa no roteiro PT. Retorna (texto_pt, falhas)."""
+    secoes_pt, secoes_en = utils.dividir_capitulos(texto_pt), utils.dividir_capitulos(texto_en)
+    falhas = []
+    for i in indices:
+        if i >= len(secoes_en) or i >= len(secoes_pt): continue
+        secoes_pt[i], ok = _traduzir_secao(secoes_en[i])
+        if not ok: falhas.append(i)
+    return "".join(secoes_pt), falhas
 
 # --- 5. CRÍTICO E REESCRITOR ---
-def agente_critico(texto_completo, generos):
+def agente_critico(texto_completo, generos, stream=False):
     prompt = f"""
     ATUE COMO: Editor Literário de {generos}.
     ANALISE: "{texto_completo}"
     CRITIQUE: Motivação do Vilão, Final e Clichês.
     SAÍDA: Lista de melhorias em Português.
     """
-    return _gerar_texto(prompt)
+    if stream: return _gerar_texto_stream(prompt, agente="critico")
+    return _gerar_texto(prompt, agente="critico")
 
-def agente_reescritor(texto_atual, critica, generos):
+def agente_reescritor(texto_atual, critica, generos, stream=False):
     prompt = f"""
     ATUE COMO: Ghostwriter.
     TAREFA: Reescreva aplicando a crítica.
@@ -112,4 +455,87 @@ def agente_reescritor(texto_atual, critica, generos):
     CRÍTICA: "{critica}"
     SAÍDA: História completa reescrita em Português (Markdown).
     """
-    return _gerar_texto(prompt)
+    if stream: return _gerar_texto_stream(prompt, agente="reescritor")
+    return _gerar_texto(prompt, agente="reescritor")
+
+# --- 6. REFINAMENTO POR CAPÍTULO ---
+def agente_critico_por_capitulo(texto_completo, generos):
+    """
+    Crítica estruturada: retorna {"geral": str, "capitulos": [{"indice", "titulo", "notas"}]}.
+    Só entram capítulos que realmente precisam mudar (índice 0-based).
+    """
+    secoes = utils.dividir_capitulos(texto_completo)
+    numerado = "\n\n".join(f"[CAPÍTULO {i + 1}]\n{s.strip()}" for i, s in enumerate(secoes))
+    prompt = f"""
+    ATUE COMO: Editor Literário de {generos}.
+    ANALISE a história abaixo, dividida em {len(secoes)} capítulos numerados:
+    {numerado}
+    CRITIQUE: Motivação do Vilão, Final e Clichês.
+    SAÍDA (JSON): {{"geral": "resumo da crítica em Português",
+                    "capitulos": [{{"capitulo": <número>, "notas": "o que mudar neste capítulo"}}]}}
+    Inclua SOMENTE os capítulos que precisam ser alterados.
+    """
+    resposta = _gerar_texto(prompt, json_mode=True, agente="critico")
+    try:
+        dados = json.loads(resposta)
+    except (TypeError, ValueError):
+        return {"geral": resposta, "capitulos": []}
+
+    capitulos = []
+    for item in dados.get("capitulos", []) if isinstance(dados, dict) else []:
+        try:
+            indice = int(item.get("capitulo")) - 1
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if 0 <= indice < len(secoes) and item.get("notas"):
+            titulo = (secoes[indice].strip().splitlines() or [""])[0].lstrip("# ").strip()
+            capitulos.append({"indice": indice, "titulo": titulo, "notas": item["notas"]})
+    return {"geral": dados.get("geral", "") if isinstance(dados, dict) else "", "capitulos": capitulos}
+
+def formatar_critica(critica):
+    """Versão em Markdown da crítica estruturada (para exibir e para o reescritor completo)."""
+    linhas = [critica.get("geral", "")]
+    for c in critica.get("capitulos", []):
+        linhas.append(f"- **Cap. {c['indice'] + 1} — {c['titulo']}:** {c['notas']}")
+    return "\n".join(l for l in linhas if l)
+
+def agente_reescritor_capitulo(secao, notas, generos):
+    """Reescreve só o corpo de uma seção '## '; título e espaçamento original são mantidos."""
+    inicio = secao[:len(secao) - len(secao.lstrip())]
+    fim = secao[len(secao.rstrip()):]
+    nucleo = secao.strip()
+    titulo, separador, corpo = "", "", nucleo
+    if nucleo.startswith("## "):
+        titulo, _, resto = nucleo.partition("\n")
+        corpo = resto.lstrip()
+        separador = "\n" + resto[:len(resto) - len(corpo)]
+    prompt = f"""
+    ATUE COMO: Ghostwriter ({generos}).
+    TAREFA: Reescreva este capítulo aplicando as notas. Mantenha nomes e a ligação com os capítulos vizinhos.
+    CAPÍTULO: "{corpo}"
+    NOTAS: "{notas}"
+    SAÍDA: Apenas o texto do capítulo reescrito em Português (sem título).
+    """
+    novo = _gerar_texto(prompt, agente="reescritor")
+    # Mantém o original se a chamada falhar ou vier vazia
+    if not isinstance(novo, str) or not novo.strip() or novo.startswith("Erro"): return secao
+    reescrita = f"{inicio}{titulo}{separador}{novo.strip()}{fim}"
+    # Se o modelo inventou um '## ' no meio, a seção viraria duas: mantém o original
+    if len(utils.dividir_capitulos(reescrita)) != 1:
+        print(f"Reescrita descartada (quebraria a divisão em capítulos): {titulo or 'abertura'}")
+        return secao
+    return reescrita
+
+def reescrever_capitulos(texto_atual, critica, generos, max_workers=4):
+    """
+    Reescreve em paralelo só os capítulos apontados pela crítica estruturada;
+    os demais ficam intactos. Retorna o texto completo remontado em ordem.
+    """
+    secoes = utils.dividir_capitulos(texto_atual)
+    alvos = {c["indice"]: c["notas"] for c in critica.get("capitulos", []) if c["indice"] < len(secoes)}
+    if not alvos: return texto_atual
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {i: executor.submit(metricas.propagar(agente_reescritor_capitulo), secoes[i], notas, generos) for i, notas in alvos.items()}
+        for i, futuro in futuros.items():
+            secoes[i] = futuro.result()
+    return "".join(secoes)
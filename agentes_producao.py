@@ -1,94 +1,294 @@
 import os
+import re
+import math
 import edge_tts
 import asyncio
 from PIL import Image
 import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
 import utils # Usa o utils para pegar cliente
+import cache_imagens
+import render_ffmpeg
+import metricas
+import limitador
 from google.genai import types
 
 # --- CORREÇÃO DE IMPORTS (COMPATIBILIDADE MOVIEPY v2) ---
 try:
-    # Tenta importar do jeito novo (MoviePy v2.0+)
-    from moviepy.audio.io.AudioFileClip import AudioFileClip
-    from moviepy.video.VideoClip import ImageClip
-    from moviepy.video.compositing.concatenate import concatenate_videoclips
+    # MoviePy v2.x (release): tudo exportado no pacote raiz
+    from moviepy import AudioFileClip, ImageClip, concatenate_videoclips
 except ImportError:
-    # Fallback para versão antiga (v1.x)
-    from moviepy.editor import AudioFileClip, ImageClip, concatenate_videoclips
+    try:
+        # Tenta importar do jeito novo (MoviePy v2.0 dev)
+        from moviepy.audio.io.AudioFileClip import AudioFileClip
+        from moviepy.video.VideoClip import ImageClip
+        from moviepy.video.compositing.concatenate import concatenate_videoclips
+    except ImportError:
+        # Fallback para versão antiga (v1.x)
+        from moviepy.editor import AudioFileClip, ImageClip, concatenate_videoclips
 # --------------------------------------------------------
 
 # --- ÁUDIO (TTS) ---
-async def _tts_async(texto, voz, arquivo):
+# O edge-tts devolve MP3 CBR 48 kbps mono: os pedaços podem ser concatenados
+# byte a byte (sem re-encode) e a duração sai direto do tamanho.
+TTS_BITRATE = 48000
+TTS_MAX_CHARS = 2500
+TTS_CONCORRENCIA = 4
+TTS_TENTATIVAS = 3
+
+def _limpar_markdown(texto):
+    return texto.replace("##", "").replace("**", "").replace("*", "")
+
+def dividir_texto_tts(texto, max_chars=TTS_MAX_CHARS):
+    """Divide o roteiro nos cabeçalhos '## ' e, se o capítulo for grande, por frases."""
+    blocos = [b for b in re.split(r'(?m)^(?=## )', texto) if b.strip()]
+    partes = []
+    for bloco in blocos:
+        if len(bloco) <= max_chars:
+            partes.append(bloco)
+            continue
+        atual = ""
+        for frase in re.split(r'(?<=[.!?…])\s+', bloco):
+            if atual and len(atual) + len(frase) + 1 > max_chars:
+                partes.append(atual)
+                atual = ""
+            atual = f"{atual} {frase}" if atual else frase
+        if atual: partes.append(atual)
+    return partes
+
+async def _tts_bytes(texto, voz):
+    audio = bytearray()
     communicate = edge_tts.Communicate(texto, voz)
-    await communicate.save(arquivo)
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            audio.extend(chunk["data"])
+    if not audio: raise RuntimeError("TTS retornou áudio vazio")
+    return bytes(audio)
 
-def gerar_audio(texto, idioma, titulo):
+async def _tts_partes_async(partes, voz, concorrencia, tentativas):
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def sintetizar(i, texto):
+        async with semaforo:
+            for tentativa in range(1, tentativas + 1):
+                try:
+                    return await _tts_bytes(texto, voz)
+                except Exception as e:
+                    # Só este pedaço é refeito
+                    print(f"Erro TTS (parte {i}, tentativa {tentativa}): {e}")
+                    if tentativa == tentativas: raise
+                    await asyncio.sleep(2 ** tentativa)
+
+    return await asyncio.gather(*(sintetizar(i, t) for i, t in enumerate(partes)))
+
+def gerar_audio_com_duracoes(texto, idioma, titulo, concorrencia=TTS_CONCORRENCIA, arquivo=None):
+    """
+    TTS em partes paralelas. Retorna (caminho, duracoes_por_parte) ou (None, []).
+    As partes seguem a ordem do texto (título + capítulos).
+    """
     if not os.path.exists("temp"): os.makedirs("temp")
     voz = "pt-BR-AntonioNeural" if idioma == "pt" else "en-US-ChristopherNeural"
-    arquivo = f"temp/audio_{idioma}.mp3"
-    texto_limpo = texto.replace("##", "").replace("**", "").replace("*", "")
-    texto_final = f"{titulo}.\n\n{texto_limpo}"
-    try:
-        asyncio.run(_tts_async(texto_final, voz, arquivo))
-        return arquivo
-    except Exception as e:
-        print(f"Erro TTS: {e}")
-        return None
+    arquivo = arquivo or f"temp/audio_{idioma}.mp3"
+    partes = [_limpar_markdown(p) for p in dividir_texto_tts(texto)]
+    if partes:
+        partes[0] = f"{titulo}.\n\n{partes[0]}"
+    else:
+        partes = [f"{titulo}."]
+    with metricas.span("gerar_audio", modelo="edge-tts", idioma=idioma, partes=len(partes),
+                       chars=len(texto or ""), chars_tts=sum(len(p) for p in partes)) as m:
+        try:
+            audios = asyncio.run(_tts_partes_async(partes, voz, concorrencia, TTS_TENTATIVAS))
+            with open(arquivo, "wb") as f:
+                for a in audios: f.write(a)
+            duracoes = [len(a) * 8 / TTS_BITRATE for a in audios]
+            m["bytes"] = sum(len(a) for a in audios)
+            m["segundos_audio"] = round(sum(duracoes), 2)
+            return arquivo, duracoes
+        except Exception as e:
+            print(f"Erro TTS: {e}")
+            m["erro"] = str(e)
+            return None, []
+
+def duracoes_por_capitulo(texto, duracoes_partes):
+    """Soma as durações das partes do TTS por capítulo '## ' (texto antes do 1º título vai junto com ele)."""
+    partes = dividir_texto_tts(texto)
+    if not partes or len(partes) != len(duracoes_partes): return []
+    capitulos = []
+    for parte, duracao in zip(partes, duracoes_partes):
+        if parte.lstrip().startswith("## ") or not capitulos: capitulos.append(duracao)
+        else: capitulos[-1] += duracao
+    if not partes[0].lstrip().startswith("## ") and len(capitulos) > 1:
+        capitulos[1] += capitulos.pop(0)
+    return capitulos
+
+def duracoes_por_cena(caminhos_imagens, duracoes_capitulos):
+    """
+    Reparte a narração de cada capítulo entre as imagens dele.
+    `caminhos_imagens` em ordem de capítulo, com None onde a imagem falhou
+    (os prompts são gerados em blocos iguais por capítulo).
+    Retorna (imagens válidas, segundos de cada uma) ou (imagens, None) sem durações.
+    """
+    validas = [c for c in caminhos_imagens if c]
+    if not duracoes_capitulos or not validas: return validas, None
+    tamanho = math.ceil(len(caminhos_imagens) / len(duracoes_capitulos))
+    imagens, duracoes, sobra = [], [], 0.0
+    for i, duracao in enumerate(duracoes_capitulos):
+        bloco = [c for c in caminhos_imagens[i * tamanho:(i + 1) * tamanho] if c]
+        if not bloco:
+            sobra += duracao  # capítulo sem imagem: a narração fica com a próxima cena
+            continue
+        imagens += bloco
+        duracoes += [(duracao + sobra) / len(bloco)] * len(bloco)
+        sobra = 0.0
+    if sobra: duracoes[-1] += sobra
+    return imagens, duracoes
+
+def gerar_audio(texto, idioma, titulo):
+    arquivo, _ = gerar_audio_com_duracoes(texto, idioma, titulo)
+    return arquivo
 
 # --- IMAGEM (NOVA LIB) ---
-def gerar_imagem_ia(prompt, nome_arquivo):
-    if not os.path.exists("temp"): os.makedirs("temp")
-    caminho_final = f"temp/{nome_arquivo}.png"
+MODELO_IMAGEM = 'imagen-4.0-fast-generate-001'
+ASPECT_RATIO = "16:9"
+SAFETY_LEVEL = "block_low_and_above"
+
+def gerar_imagem_ia(prompt, nome_arquivo=None):
+    """
+    Gera (ou reaproveita do cache) a imagem do prompt.
+    O cache é endereçado por conteúdo (prompt + modelo + formato + segurança),
+    então sobrevive a reinícios. `nome_arquivo` só é usado no fallback preto.
+    """
+    with metricas.span("gerar_imagem", modelo=MODELO_IMAGEM) as m:
+        if not os.path.exists("temp"): os.makedirs("temp")
     
-    # Verifica cache (para não gastar dinheiro a toa)
-    if os.path.exists(caminho_final): return caminho_final
+        # Verifica cache (para não gastar dinheiro a toa)
+        chave = cache_imagens.chave_imagem(prompt, MODELO_IMAGEM, ASPECT_RATIO, SAFETY_LEVEL)
+        em_cache = cache_imagens.buscar(chave)
+        m["cache"] = bool(em_cache)
+        if em_cache: return em_cache
 
-    client = utils.get_google_client()
-    if not client: return None
+        client = utils.get_google_client()
+        if not client:
+            m["erro"] = "sem cliente"
+            return None
 
-    try:
-        print(f"🎨 Gerando: {nome_arquivo}...")
-        response = client.models.generate_images(
-            model='imagen-4.0-fast-generate-001',
-            prompt=prompt,
-            config=types.GenerateImagesConfig(
-                number_of_images=1,
-                aspect_ratio="16:9",
-                safety_filter_level="block_low_and_above"
+        caminho_final = cache_imagens.caminho_para(chave)
+        os.makedirs(os.path.dirname(caminho_final), exist_ok=True)
+        try:
+            print(f"🎨 Gerando: {nome_arquivo or chave[:8]}...")
+            # Passa pelo limitador compartilhado (refaz 429/5xx com backoff)
+            response = limitador.obter("imagem", MODELO_IMAGEM).executar(
+                client.models.generate_images,
+                model=MODELO_IMAGEM,
+                prompt=prompt,
+                config=types.GenerateImagesConfig(
+                    number_of_images=1,
+                    aspect_ratio=ASPECT_RATIO,
+                    safety_filter_level=SAFETY_LEVEL
+                )
             )
-        )
-        # Extração
-        generated_image = response.generated_images[0].image
-        if isinstance(generated_image, types.Image):
-            image_bytes = generated_image.image_bytes
-            pil_image = Image.open(io.BytesIO(image_bytes))
-            pil_image.save(caminho_final)
+            # Extração
+            generated_image = response.generated_images[0].image
+            if isinstance(generated_image, types.Image):
+                image_bytes = generated_image.image_bytes
+                pil_image = Image.open(io.BytesIO(image_bytes))
+                pil_image.save(caminho_final)
+            else:
+                generated_image.save(caminho_final)
+            m["imagens"] = 1
+            m["bytes"] = os.path.getsize(caminho_final)
+            return cache_imagens.registrar(chave, prompt)
+
+        except Exception as e:
+            print(f"❌ Erro Imagem: {e}")
+            m["erro"] = str(e)
+            m["fallback"] = True
+            # Fallback de imagem preta (fora do cache, para tentar de novo na próxima)
+            try:
+                caminho_fallback = f"temp/{nome_arquivo or 'fallback_' + chave[:8]}.png"
+                img = Image.new('RGB', (1920, 1080), color=(10, 10, 10))
+                img.save(caminho_fallback)
+                return caminho_fallback
+            except: return None
+
+def gerar_imagens_em_lote(prompts, nomes_arquivos=None, max_workers=4, ao_concluir=None):
+    """
+    Gera várias imagens em paralelo (até `max_workers` chamadas simultâneas).
+    Cada item passa pelo gerar_imagem_ia (mesmo cache em disco e fallback preto).
+    `ao_concluir(feitos, total)` é chamado na thread principal a cada imagem pronta,
+    na ordem em que terminarem. Retorna os caminhos na ordem dos prompts.
+    """
+    total = len(prompts)
+    caminhos = [None] * total
+    if not total: return caminhos
+    if nomes_arquivos is None: nomes_arquivos = [None] * total
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        futuros = {
+            executor.submit(metricas.propagar(gerar_imagem_ia), p, nome): i
+            for i, (p, nome) in enumerate(zip(prompts, nomes_arquivos))
+        }
+        for feitos, futuro in enumerate(as_completed(futuros), start=1):
+            i = futuros[futuro]
+            try:
+                caminhos[i] = futuro.result()
+            except Exception as e:
+                print(f"❌ Erro Imagem (lote): {e}")
+            if ao_concluir: ao_concluir(feitos, total)
+
+    return caminhos
+
+# --- VÍDEO ---
+BACKENDS_RENDER = ["moviepy", "ffmpeg", "segmentado"]
+
+def renderizar_video_com_imagens(audio_path, lista_imagens, idioma, backend="moviepy", output=None, duracoes_cenas=None):
+    """
+    Renderiza o vídeo 16:9 com zoom. backend: "moviepy" (original), "ffmpeg" (grafo nativo)
+    ou "segmentado" (uma cena por processo + concat sem re-encode).
+    `duracoes_cenas` (ver duracoes_por_cena) faz cada imagem durar o trecho narrado
+    do seu capítulo; sem ele, o áudio é dividido por igual.
+    `output` padrão: video_final_{idioma}.mp4
+    """
+    if not audio_path or not os.path.exists(audio_path): return None
+    if not lista_imagens: return None
+    output = output or f"video_final_{idioma}.mp4"
+    with metricas.span("renderizar", backend=backend, idioma=idioma, cenas=len(lista_imagens)) as m:
+        if backend in ("ffmpeg", "segmentado"):
+            video = _renderizar_ffmpeg(audio_path, lista_imagens, output, backend, duracoes_cenas)
         else:
-            generated_image.save(caminho_final)
-        return caminho_final
+            video = _renderizar_moviepy(audio_path, lista_imagens, output, duracoes_cenas)
+        if video and os.path.exists(video):
+            m["bytes"] = os.path.getsize(video)
+            try:
+                m["segundos_video"] = round(render_ffmpeg.duracao_midia(video), 2)
+                m["frames"] = round(m["segundos_video"] * render_ffmpeg.FPS)
+            except Exception:
+                pass
+        else:
+            m["erro"] = "renderizador retornou None"
+        return video
 
+def _renderizar_ffmpeg(audio_path, lista_imagens, output, backend="ffmpeg", duracoes=None):
+    try:
+        if backend == "segmentado":
+            return render_ffmpeg.renderizar_segmentado(audio_path, lista_imagens, output, duracoes=duracoes)
+        return render_ffmpeg.renderizar_ken_burns(audio_path, lista_imagens, output, duracoes=duracoes)
     except Exception as e:
-        print(f"❌ Erro Imagem: {e}")
-        # Fallback de imagem preta
-        try:
-            img = Image.new('RGB', (1920, 1080), color=(10, 10, 10))
-            img.save(caminho_final)
-            return caminho_final
-        except: return None
+        print(f"Erro renderização (ffmpeg): {e}")
+        return None
 
-# --- VÍDEO ---
-def renderizar_video_com_imagens(audio_path, lista_imagens, idioma):
-    if not os.path.exists(audio_path): return None
-    
+def _renderizar_moviepy(audio_path, lista_imagens, output, duracoes=None):
     try:
         audio = AudioFileClip(audio_path)
         duracao_total = audio.duration
         if not lista_imagens: return None
-        tempo_por_imagem = duracao_total / len(lista_imagens)
+        # Mesma divisão do backend ffmpeg (proporcional às durações, se houver)
+        frames = render_ffmpeg.frames_por_cena(duracao_total, len(lista_imagens), 24, duracoes)
         
         clips = []
-        for img_path in lista_imagens:
+        for img_path, n_frames in zip(lista_imagens, frames):
+            tempo_por_imagem = n_frames / 24
             try:
                 # Cria clip e define duração
                 clip = ImageClip(img_path).with_duration(tempo_por_imagem).with_position('center')
@@ -112,7 +312,6 @@ def renderizar_video_com_imagens(audio_path, lista_imagens, idioma):
         video_final = concatenate_videoclips(clips, method="compose")
         video_final = video_final.with_audio(audio) if hasattr(video_final, 'with_audio') else video_final.set_audio(audio)
         
-        output = f"video_final_{idioma}.mp4"
         
         # Renderização
         video_final.write_videofile(
@@ -1,5 +1,9 @@
 import streamlit as st
 import utils
+import agentes_escrita
+import metricas
+import limitador
+import pandas as pd
 
 st.set_page_config(page_title="Content Farm IA", page_icon="🏭", layout="wide")
 
@@ -40,6 +44,13 @@ with col3:
 # Setup Inicial (Testa todas as conexões)
 if utils.setup_api():
     st.toast("Todas as APIs conectadas (Texto + Imagem + DB)", icon="✅")
+    # Opcional (AQUECER_CLIENTES=1); só a primeira sessão do processo paga a chamada
+    aquecimento_ms = utils.aquecer_clientes(agentes_escrita.MODELO_TEXTO) if utils.AQUECER_CLIENTES else None
+    stats_cli = utils.estatisticas_clientes()
+    st.caption(
+        f"🔌 Conexões: {stats_cli['criados']} cliente(s) criado(s), {stats_cli['reutilizados']} reuso(s)"
+        + (f" · aquecimento {aquecimento_ms:.0f} ms" if aquecimento_ms else "")
+    )
 else:
     st.error("⚠️ Erro nas conexões. Verifique o secrets.toml")
 
@@ -56,3 +67,35 @@ st.divider()
 
 if st.session_state.get('texto_completo_pt'):
     st.success(f"📝 Existe um roteiro ativo na memória: **{st.session_state.get('tema_atual', 'Sem título')}**")
+
+# --- MÉTRICAS ---
+metricas.iniciar_servidor()
+with st.expander("📈 Métricas das últimas execuções"):
+    eventos = metricas.ultimos_eventos(500)
+    if not eventos:
+        st.caption("Nenhuma execução registrada ainda.")
+    else:
+        df = pd.DataFrame(eventos)
+        for col in ["tokens_prompt", "tokens_resposta", "imagens", "bytes", "custo_usd"]:
+            if col not in df: df[col] = 0
+        resumo = df.groupby("op").agg(
+            chamadas=("op", "size"),
+            tempo_total_s=("duracao_s", "sum"),
+            tempo_medio_s=("duracao_s", "mean"),
+            tokens_prompt=("tokens_prompt", "sum"),
+            tokens_resposta=("tokens_resposta", "sum"),
+            imagens=("imagens", "sum"),
+            mb_escritos=("bytes", lambda b: b.sum() / (1024 * 1024)),
+            custo_usd=("custo_usd", "sum"),
+        ).round(4)
+        st.caption(f"💰 Custo estimado: US$ {df['custo_usd'].sum():.4f}")
+        st.dataframe(resumo)
+        if "fps_render" in df:
+            renders = df[df["op"] == "renderizar"][["backend", "duracao_s", "segundos_video", "fps_render"]].tail(5)
+            st.caption("Últimas renderizações")
+            st.dataframe(renders, hide_index=True)
+    estado_limites = limitador.estado_geral()
+    if estado_limites:
+        st.caption("Limitadores (taxa/s, concorrência, 429s)")
+        st.dataframe(pd.DataFrame(estado_limites).T)
+    st.caption(f"Prometheus: http://{metricas.HOST_PROMETHEUS}:{metricas.PORTA_PROMETHEUS}/metrics · JSONL: {metricas.ARQUIVO_JSONL}")
@@ -0,0 +1,209 @@
+"""
+Benchmark offline do pipeline (sem APIs pagas).
+
+Substitui o genai.Client (texto e imagem) e o edge_tts.Communicate por
+versões locais determinísticas, com latência e tamanho configuráveis, e
+cronometra cada etapa em vários tamanhos de história.
+
+Uso:
+    python benchmark.py --capitulos 2,8,16 --saida temp/benchmark.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+from PIL import Image
+
+import utils
+import cache_llm
+import cache_imagens
+import metricas
+import limitador
+import render_ffmpeg
+import agentes_escrita
+import agentes_producao
+
+# --- FAKES ---
+class FakeModels:
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+    def _texto(self, prompt, palavras):
+        rnd = random.Random(prompt)
+        vocab = ["shadow", "door", "night", "voice", "forest", "cabin", "light", "storm", "blood", "silence"]
+        return " ".join(rnd.choice(vocab) for _ in range(palavras)) + "."
+
+    def _responder(self, prompt, config):
+        time.sleep(self.cfg.latencia_texto)
+        if "image_prompts" in prompt:
+            cena = random.Random(prompt).randrange(10 ** 6)
+            return json.dumps({
+                "summary": self._texto(prompt, 45),
+                "image_prompts": [
+                    {"shot": "wide", "subject": f"scene {cena}-{i}", "setting": "forest", "lighting": "moonlight"}
+                    for i in range(agentes_escrita.PROMPTS_POR_CAPITULO)
+                ],
+            })
+        if "Continuity Editor" in prompt:
+            abertura = prompt.split("OPENING OF THIS CHAPTER: \"", 1)[1].split("\"\n", 1)[0]
+            return json.dumps({"opening": abertura, "renames": {}})
+        if (config or {}).get('response_mime_type') == 'application/json':
+            n = self.cfg.capitulos
+            return json.dumps([{"title": f"Chapter {i}", "events": f"Events of chapter {i}."} for i in range(1, n + 1)])
+        if prompt.startswith("Traduza"):
+            return prompt.split("\n", 1)[-1]
+        return self._texto(prompt, self.cfg.palavras_capitulo)
+
+    def generate_content(self, model, contents, config=None):
+        return SimpleNamespace(text=self._responder(contents, config))
+
+    def generate_content_stream(self, model, contents, config=None):
+        texto = self._responder(contents, config)
+        for i in range(0, len(texto), 200):
+            yield SimpleNamespace(text=texto[i:i + 200])
+
+    def generate_images(self, model, prompt, config=None):
+        time.sleep(self.cfg.latencia_imagem)
+        cor = tuple(random.Random(prompt).randrange(256) for _ in range(3))
+        imagem = SimpleNamespace(save=lambda caminho: Image.new('RGB', self.cfg.tamanho_imagem, cor).save(caminho))
+        return SimpleNamespace(generated_images=[SimpleNamespace(image=imagem)])
+
+class FakeClient:
+    def __init__(self, cfg):
+        self.models = FakeModels(cfg)
+
+_MP3_SEGUNDO = None
+
+def _mp3_silencio_1s():
+    """1 s de MP3 CBR 48 kbps (mesmo formato do edge-tts), repetível byte a byte."""
+    global _MP3_SEGUNDO
+    if _MP3_SEGUNDO is None:
+        with tempfile.TemporaryDirectory() as tmp:
+            arquivo = os.path.join(tmp, "s.mp3")
+            subprocess.run([
+                render_ffmpeg.ffmpeg_exe(), "-loglevel", "error", "-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono",
+                "-t", "1", "-c:a", "libmp3lame", "-b:a", "48k", "-write_xing", "0", "-id3v2_version", "0", arquivo
+            ], check=True)
+            with open(arquivo, "rb") as f:
+                _MP3_SEGUNDO = f.read()
+    return _MP3_SEGUNDO
+
+def criar_fake_communicate(cfg):
+    class FakeCommunicate:
+        def __init__(self, texto, voz):
+            self.texto = texto
+
+        async def stream(self):
+            # ~2.5 palavras por segundo de narração; latência proporcional ao texto
+            segundos = max(1, round(len(self.texto.split()) / 2.5))
+            await asyncio.sleep(cfg.latencia_tts + segundos * cfg.tts_por_segundo)
+            yield {"type": "audio", "data": _mp3_silencio_1s() * segundos}
+
+        async def save(self, arquivo):
+            with open(arquivo, "wb") as f:
+                async for chunk in self.stream():
+                    f.write(chunk["data"])
+    return FakeCommunicate
+
+def instalar_fakes(cfg, pasta):
+    cliente = FakeClient(cfg)
+    utils.get_google_client = lambda: cliente
+    agentes_producao.edge_tts.Communicate = criar_fake_communicate(cfg)
+    # Caches desligados/isolados: cada medição paga o custo real da etapa
+    cache_llm.CONFIG["ativo"] = False
+    cache_llm.CONFIG["traducoes"] = False
+    cache_imagens.PASTA_CACHE = os.path.join(pasta, "imagens")
+    cache_imagens.ARQUIVO_INDICE = os.path.join(cache_imagens.PASTA_CACHE, "index.json")
+    cache_imagens._indice = None
+    render_ffmpeg.PASTA_SEGMENTOS = os.path.join(pasta, "segmentos")
+    # Spans (e custos) das chamadas falsas não entram no painel de custo do app
+    metricas.ARQUIVO_JSONL = os.path.join(pasta, "metricas.jsonl")
+    # Limitador "livre": as taxas iniciais (chutes para a cota real) não viram um piso
+    # fixo de tempo que esconde latência, workers e regressões
+    if cfg.limitador == "livre":
+        for api in list(limitador.PADROES):
+            limitador.configurar(api, taxa=1000.0, taxa_max=1000.0, concorrencia=1000, concorrencia_max=1000)
+    limitador._limitadores.clear()
+
+# --- MEDIÇÃO ---
+def cronometrar(func):
+    inicio = time.perf_counter()
+    resultado = func()
+    return resultado, round(time.perf_counter() - inicio, 3)
+
+def rodar(cfg, n_capitulos, pasta):
+    cfg.capitulos = n_capitulos
+    tempos = {}
+    plano = agentes_escrita.agente_planejador("Synopsis.", "Suspense")
+
+    (texto_en, prompts, _), tempos["rascunho"] = cronometrar(
+        lambda: agentes_escrita.MODOS_ESCRITA[cfg.modo_escrita](plano, "Synopsis.", "Suspense")
+    )
+    (texto_pt, _), tempos["traducao"] = cronometrar(lambda: agentes_escrita.agente_tradutor(texto_en))
+    (audio, _), tempos["tts"] = cronometrar(
+        lambda: agentes_producao.gerar_audio_com_duracoes(texto_pt, "pt", "Bench", arquivo=os.path.join(pasta, f"audio_{n_capitulos}.mp3"))
+    )
+    imagens, tempos["imagens"] = cronometrar(lambda: agentes_producao.gerar_imagens_em_lote(prompts, max_workers=cfg.workers_imagens))
+    video, tempos["render"] = cronometrar(lambda: agentes_producao.renderizar_video_com_imagens(
+        audio, [i for i in imagens if i], "pt", backend=cfg.backend, output=os.path.join(pasta, f"video_{n_capitulos}.mp4")
+    ))
+    return {
+        "capitulos": n_capitulos,
+        "cenas": len(prompts),
+        "duracao_audio_s": round(render_ffmpeg.duracao_midia(audio), 1) if audio else None,
+        "video_ok": bool(video),
+        "tempos_s": tempos,
+        "total_s": round(sum(tempos.values()), 3),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline.")
+    parser.add_argument("--capitulos", default="2,8", help="tamanhos de história, ex: 2,8,16")
+    parser.add_argument("--palavras-capitulo", type=int, default=450)
+    parser.add_argument("--latencia-texto", type=float, default=0.5, help="s por chamada de texto")
+    parser.add_argument("--latencia-imagem", type=float, default=1.0, help="s por imagem")
+    parser.add_argument("--latencia-tts", type=float, default=0.3, help="s fixos por chamada de TTS")
+    parser.add_argument("--tts-por-segundo", type=float, default=0.01, help="s por segundo de áudio")
+    parser.add_argument("--tamanho-imagem", default="1408x768")
+    parser.add_argument("--workers-imagens", type=int, default=4)
+    parser.add_argument("--backend", default="ffmpeg", choices=agentes_producao.BACKENDS_RENDER)
+    parser.add_argument("--modo-escrita", default="sequencial", choices=list(agentes_escrita.MODOS_ESCRITA))
+    parser.add_argument("--limitador", default="livre", choices=["livre", "padrao"],
+                        help="livre: sem teto de taxa/concorrência; padrao: PADROES do limitador")
+    parser.add_argument("--saida", default="temp/benchmark.json")
+    args = parser.parse_args(argv)
+    args.tamanho_imagem = tuple(int(x) for x in args.tamanho_imagem.split("x"))
+
+    pasta = tempfile.mkdtemp(prefix="bench_")
+    instalar_fakes(args, pasta)
+
+    resultados = []
+    for n in [int(x) for x in args.capitulos.split(",")]:
+        r = rodar(args, n, pasta)
+        print(f"{n:>3} capítulos: " + " · ".join(f"{k} {v:.2f}s" for k, v in r["tempos_s"].items()) + f" | total {r['total_s']:.2f}s")
+        resultados.append(r)
+
+    relatorio = {
+        "config": {
+            **{k: v for k, v in vars(args).items() if k not in ("saida", "capitulos")},
+            "limites": {api: dict(valores) for api, valores in limitador.PADROES.items()},
+        },
+        "ambiente": {"python": platform.python_version(), "cpus": os.cpu_count(), "sistema": platform.system()},
+        "resultados": resultados,
+    }
+    os.makedirs(os.path.dirname(args.saida) or ".", exist_ok=True)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2, sort_keys=True, default=str)
+    print(f"Resultados em {args.saida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+
+# --- ÍNDICE DE BUSCA LOCAL (FULL-TEXT) ---
+# Índice invertido sobre tema, sinopse e os dois roteiros.
+# Tokenização sem acentos (PT/EN), ranking TF-IDF com peso por campo.
+# Atualizado por deltas do Firestore (campo atualizado_em), não por varredura.
+# No layout de capítulos os roteiros vêm da subcoleção: cada capítulo é
+# indexado à parte e somado nos campos roteiro_pt/roteiro_en da história.
+
+ARQUIVO_INDICE = "temp/indice_busca.json"
+VERSAO_INDICE = 2  # 2 = roteiros indexados por capítulo
+PESOS_CAMPOS = {"tema": 4.0, "sinopse": 2.0, "roteiro_pt": 1.0, "roteiro_en": 1.0}
+CAMPOS_META = ["tema", "nicho", "status", "generos"]
+CAMPOS_ROTEIRO = {"roteiro_pt": "texto_pt", "roteiro_en": "texto_en"}  # campo do índice -> campo do capítulo
+
+STOPWORDS = set("""
+a o e de da do das dos em no na nos nas um uma uns umas para por com que se ao aos as os
+the of and to in on at for with is are was were be it this that an by from as or
+""".split())
+
+def normalizar(texto):
+    sem_acento = unicodedata.normalize("NFKD", texto or "")
+    sem_acento = "".join(c for c in sem_acento if not unicodedata.combining(c))
+    return sem_acento.lower()
+
+def tokenizar(texto):
+    return [t for t in re.findall(r"[a-z0-9]+", normalizar(texto)) if t not in STOPWORDS and len(t) > 1]
+
+class IndiceBusca:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.docs = {}          # id -> {"meta": {...}, "termos": {campo: {termo: tf}}}
+        self.postings = defaultdict(set)  # termo -> ids
+        self.ultimo_sync = None
+
+    # --- manutenção ---
+    def atualizar(self, doc_id, dado):
+        termos = {campo: dict(Counter(tokenizar(dado.get(campo, "")))) for campo in PESOS_CAMPOS}
+        meta = {c: dado[c] for c in CAMPOS_META if c in dado}
+        with self._lock:
+            antigo = self.docs.get(doc_id) or {}
+            # Documento no layout novo não traz os roteiros: mantém os capítulos já indexados
+            capitulos = {} if any(c in dado for c in CAMPOS_ROTEIRO) else antigo.get("capitulos", {})
+            self._indexar(doc_id, {"meta": meta, "termos": termos, "capitulos": capitulos})
+
+    def atualizar_capitulo(self, doc_id, indice, dado):
+        """Indexa um capítulo (texto_pt/texto_en) dentro da história doc_id."""
+        termos = {campo: dict(Counter(tokenizar(dado.get(origem, "")))) for campo, origem in CAMPOS_ROTEIRO.items()}
+        with self._lock:
+            doc = self.docs.get(doc_id) or {"meta": {}, "termos": {c: {} for c in PESOS_CAMPOS}, "capitulos": {}}
+            capitulos = dict(doc.get("capitulos", {}))
+            capitulos[str(int(indice))] = termos
+            self._indexar(doc_id, {**doc, "capitulos": capitulos})
+
+    def remover_capitulo(self, doc_id, indice):
+        with self._lock:
+            doc = self.docs.get(doc_id)
+            chave = str(int(indice))
+            if not doc or chave not in doc.get("capitulos", {}): return
+            capitulos = {k: v for k, v in doc["capitulos"].items() if k != chave}
+            self._indexar(doc_id, {**doc, "capitulos": capitulos})
+
+    def indexar_capitulos(self, doc_id, texto_pt, texto_en, dividir):
+        """Indexa os roteiros já divididos (`dividir` = utils.dividir_capitulos)."""
+        caps_pt, caps_en = dividir(texto_pt), dividir(texto_en)
+        for i in range(max(len(caps_pt), len(caps_en), 1)):
+            self.atualizar_capitulo(doc_id, i, {
+                "texto_pt": caps_pt[i] if i < len(caps_pt) else "",
+                "texto_en": caps_en[i] if i < len(caps_en) else "",
+            })
+
+    def remover(self, doc_id):
+        with self._lock:
+            self._remover(doc_id)
+
+    def _indexar(self, doc_id, doc):
+        # Campos de roteiro = soma dos capítulos (quando a história está no layout novo)
+        doc = {**doc, "termos": dict(doc["termos"])}  # o antigo ainda é usado pelo _remover
+        if doc.get("capitulos"):
+            for campo in CAMPOS_ROTEIRO:
+                total = Counter()
+                for cap in doc["capitulos"].values():
+                    total.update(cap.get(campo, {}))
+                doc["termos"][campo] = dict(total)
+        self._remover(doc_id)
+        self.docs[doc_id] = doc
+        for por_campo in doc["termos"].values():
+            for termo in por_campo:
+                self.postings[termo].add(doc_id)
+
+    def _remover(self, doc_id):
+        antigo = self.docs.pop(doc_id, None)
+        if not antigo: return
+        for por_campo in antigo["termos"].values():
+            for termo in por_campo:
+                ids = self.postings.get(termo)
+                if ids:
+                    ids.discard(doc_id)
+                    if not ids: del self.postings[termo]
+
+    # --- consulta ---
+    def buscar(self, consulta, limite=50):
+        """Retorna [(id, score, meta)] ordenado por relevância. O último termo casa por prefixo."""
+        tokens = tokenizar(consulta)
+        if not tokens: return []
+        with self._lock:
+            n_docs = max(len(self.docs), 1)
+            scores = defaultdict(float)
+            encontrados_por_token = []
+            for i, token in enumerate(tokens):
+                if i == len(tokens) - 1:
+                    termos = [t for t in self.postings if t.startswith(token)]
+                else:
+                    termos = [token] if token in self.postings else []
+                ids_token = set()
+                for termo in termos:
+                    ids = self.postings[termo]
+                    ids_token |= ids
+                    idf = math.log(1 + n_docs / len(ids))
+                    for doc_id in ids:
+                        for campo, peso in PESOS_CAMPOS.items():
+                            tf = self.docs[doc_id]["termos"][campo].get(termo, 0)
+                            if tf: scores[doc_id] += peso * (1 + math.log(tf)) * idf
+                encontrados_por_token.append(ids_token)
+            # Todos os termos precisam aparecer (AND)
+            validos = set.intersection(*encontrados_por_token) if encontrados_por_token else set()
+            # Capítulo que chegou antes da história (sem tema ainda) não aparece
+            validos = {d for d in validos if self.docs[d]["meta"]}
+            ranking = sorted(validos, key=lambda d: scores[d], reverse=True)[:limite]
+            return [(d, scores[d], dict(self.docs[d]["meta"])) for d in ranking]
+
+    # --- persistência ---
+    def salvar(self, caminho=ARQUIVO_INDICE):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with self._lock:
+            dados = {
+                "versao": VERSAO_INDICE,
+                "ultimo_sync": self.ultimo_sync.isoformat() if self.ultimo_sync else None,
+                "docs": self.docs,
+            }
+        tmp = caminho + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dados, f, default=str)
+        os.replace(tmp, caminho)
+
+    def carregar(self, caminho=ARQUIVO_INDICE):
+        if not os.path.exists(caminho): return
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except Exception as e:
+            print(f"Índice de busca corrompido, recriando: {e}")
+            return
+        if dados.get("versao") != VERSAO_INDICE:
+            print("Índice de busca em formato antigo, recriando.")
+            return
+        with self._lock:
+            self.docs = dados.get("docs", {})
+            self.postings = defaultdict(set)
+            for doc_id, doc in self.docs.items():
+                for por_campo in doc["termos"].values():
+                    for termo in por_campo:
+                        self.postings[termo].add(doc_id)
+            sync = dados.get("ultimo_sync")
+            self.ultimo_sync = datetime.fromisoformat(sync) if sync else None
+
+    # --- sincronização com o Firestore ---
+    def sincronizar(self, db):
+        """
+        Aplica só o que mudou desde o último sync (atualizado_em > ultimo_sync),
+        nas histórias e nos capítulos (collection group "capitulos").
+        Na primeira vez (índice vazio) faz uma varredura completa.
+        Retorna quantos documentos foram (re)indexados.
+        """
+        from firebase_admin import firestore
+        filtro = firestore.FieldFilter("atualizado_em", ">", self.ultimo_sync) if self.ultimo_sync else None
+        mais_recente = self.ultimo_sync
+        n = 0
+
+        def marcar(dado):
+            nonlocal mais_recente
+            marca = dado.get("atualizado_em") or dado.get("data_criacao")
+            if marca and (mais_recente is None or marca > mais_recente):
+                mais_recente = marca
+
+        query = db.collection("historias")
+        if filtro: query = query.where(filter=filtro)
+        for doc in query.stream():
+            dado = doc.to_dict()
+            self.atualizar(doc.id, dado)
+            marcar(dado)
+            n += 1
+
+        # Roteiros do layout de capítulos (precisa do índice de collection group em atualizado_em)
+        query = db.collection_group("capitulos")
+        if filtro: query = query.where(filter=filtro)
+        try:
+            for doc in query.stream():
+                dado = doc.to_dict()
+                self.atualizar_capitulo(doc.reference.parent.parent.id, int(dado.get("indice", doc.id)), dado)
+                marcar(dado)
+                n += 1
+        except Exception as e:
+            print(f"Busca: capítulos não sincronizaram ({e})")
+
+        self.ultimo_sync = mais_recente
+        if n: self.salvar()
+        return n
+
+_indice = None
+_indice_lock = threading.Lock()
+
+def obter_indice():
+    """Índice único por processo (compartilhado entre sessões), carregado do disco."""
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceBusca()
+            _indice.carregar()
+        return _indice
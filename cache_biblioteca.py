@@ -0,0 +1,117 @@
+import time
+import threading
+import streamlit as st
+from firebase_admin import firestore
+import busca
+import utils
+
+# --- CACHE DA BIBLIOTECA EM TEMPO REAL ---
+# Um único listener (on_snapshot) por processo mantém a coleção em memória.
+# Cada mudança no Firestore chega como delta (ADDED/MODIFIED/REMOVED) e é
+# aplicada aqui e no índice de busca; todas as sessões leem deste cache.
+# Um segundo listener na collection group "capitulos" mantém os roteiros no índice,
+# só com o que mudou depois do índice salvo (atualizado_em > ultimo_sync): os textos
+# dos capítulos não são baixados de novo a cada início de processo ou reconexão.
+# Se o stream cair (erro/rede), o cache é descartado e recriado; enquanto não
+# volta, as páginas usam a consulta paginada no servidor.
+
+ESPERA_RECONEXAO_S = 30
+_proxima_tentativa = 0.0
+
+class CacheBiblioteca:
+    def __init__(self, db):
+        self._lock = threading.Lock()
+        self._pronto = threading.Event()
+        self.historias = {}  # id -> campos da listagem
+        self.deltas_aplicados = 0
+        self.indice = busca.obter_indice()
+        # Índice nunca sincronizado: uma varredura completa (persistida) antes dos deltas
+        if self.indice.ultimo_sync is None: self.indice.sincronizar(db)
+        self._lidos = {}  # listener -> read_time do último snapshot
+        self._watch = db.collection("historias").on_snapshot(self._ao_mudar)
+        capitulos = db.collection_group("capitulos")
+        if self.indice.ultimo_sync is not None:
+            capitulos = capitulos.where(filter=firestore.FieldFilter("atualizado_em", ">", self.indice.ultimo_sync))
+        self._watch_capitulos = capitulos.on_snapshot(self._ao_mudar_capitulos)
+
+    def _marcar_sync(self, listener, read_time, mudou):
+        # O índice só avança até o listener mais atrasado: se um cair, a reassinatura
+        # (filtrada por ultimo_sync) não perde o que ele deixou de ver
+        with self._lock:
+            self._lidos[listener] = read_time
+            if len(self._lidos) == 2: self.indice.ultimo_sync = min(self._lidos.values())
+        if mudou: self.indice.salvar()
+
+    def _ao_mudar(self, col_snapshot, changes, read_time):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self.historias.pop(doc.id, None)
+                    self.indice.remover(doc.id)
+                else:
+                    dado = doc.to_dict()
+                    item = {c: dado[c] for c in utils.CAMPOS_LISTAGEM if c in dado}
+                    item['id'] = doc.id
+                    self.historias[doc.id] = item
+                    self.indice.atualizar(doc.id, dado)
+                self.deltas_aplicados += 1
+        self._marcar_sync("historias", read_time, bool(changes))
+        self._pronto.set()
+
+    def _ao_mudar_capitulos(self, col_snapshot, changes, read_time):
+        for change in changes:
+            doc = change.document
+            historia_id = doc.reference.parent.parent.id
+            if change.type.name == "REMOVED":
+                self.indice.remover_capitulo(historia_id, int(doc.id))
+            else:
+                dado = doc.to_dict()
+                self.indice.atualizar_capitulo(historia_id, dado.get("indice", int(doc.id)), dado)
+        self._marcar_sync("capitulos", read_time, bool(changes))
+
+    def aguardar(self, timeout=10):
+        return self._pronto.wait(timeout)
+
+    def listar(self, status=None, pagina=0, por_pagina=20):
+        """Retorna (itens da página, tem_proxima), mais recentes primeiro."""
+        with self._lock:
+            itens = list(self.historias.values())
+        if status and status != "Todos":
+            itens = [h for h in itens if h.get('status', 'Roteiro Pronto') == status]
+        itens.sort(key=lambda h: str(h.get('data_criacao', '')), reverse=True)
+        inicio = pagina * por_pagina
+        return itens[inicio:inicio + por_pagina], len(itens) > inicio + por_pagina
+
+    def ativo(self):
+        """False se algum dos streams fechou (o Watch não reabre sozinho depois de um erro)."""
+        return all(getattr(w, "is_active", True) for w in (self._watch, self._watch_capitulos))
+
+    def parar(self):
+        for w in (self._watch, self._watch_capitulos):
+            try: w.unsubscribe()
+            except Exception as e: print(f"Cache da biblioteca: erro ao encerrar listener: {e}")
+
+@st.cache_resource
+def obter_cache_biblioteca():
+    """Cria (uma vez por processo) o cache e espera o primeiro snapshot."""
+    cache = CacheBiblioteca(firestore.client())
+    if not cache.aguardar():
+        print("Cache da biblioteca: primeiro snapshot demorou, seguindo assim mesmo.")
+    return cache
+
+def obter_cache_ativo():
+    """
+    Cache com listener vivo, ou None (quem chama usa a consulta paginada).
+    Listener morto é descartado e recriado, no máximo a cada ESPERA_RECONEXAO_S.
+    """
+    global _proxima_tentativa
+    cache = obter_cache_biblioteca()
+    if cache.ativo(): return cache
+    if time.time() < _proxima_tentativa: return None
+    print("Cache da biblioteca: listener caiu, assinando de novo.")
+    _proxima_tentativa = time.time() + ESPERA_RECONEXAO_S
+    cache.parar()
+    obter_cache_biblioteca.clear()
+    cache = obter_cache_biblioteca()
+    return cache if cache.ativo() else None
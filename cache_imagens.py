@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# --- CACHE DE IMAGENS (ENDEREÇADO POR CONTEÚDO) ---
+# Chave estável = sha256(prompt + modelo + aspect ratio + nível de segurança).
+# Ao contrário do hash() do Python, não muda entre reinícios do processo.
+
+PASTA_CACHE = "temp/imagens"
+ARQUIVO_INDICE = os.path.join(PASTA_CACHE, "index.json")
+LIMITE_CACHE_MB = int(os.environ.get("LIMITE_CACHE_IMAGENS_MB", "1024"))
+
+_lock = threading.Lock()
+_indice = None
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def chave_imagem(prompt, modelo, aspect_ratio, safety):
+    base = json.dumps([prompt, modelo, aspect_ratio, safety], ensure_ascii=False)
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+def caminho_para(chave):
+    return os.path.join(PASTA_CACHE, f"{chave[:32]}.png")
+
+def _carregar_indice():
+    global _indice
+    if _indice is not None: return _indice
+    _indice = {}
+    if os.path.exists(ARQUIVO_INDICE):
+        try:
+            with open(ARQUIVO_INDICE, "r", encoding="utf-8") as f:
+                _indice = json.load(f)
+        except Exception as e:
+            print(f"Índice de imagens corrompido, recriando: {e}")
+            _indice = {}
+    return _indice
+
+def _salvar_indice():
+    os.makedirs(PASTA_CACHE, exist_ok=True)
+    tmp = ARQUIVO_INDICE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_indice, f)
+    os.replace(tmp, ARQUIVO_INDICE)
+
+def buscar(chave):
+    """Retorna o caminho da imagem em cache (e marca o acesso) ou None."""
+    with _lock:
+        indice = _carregar_indice()
+        entrada = indice.get(chave)
+        if entrada and os.path.exists(entrada["arquivo"]):
+            entrada["ultimo_acesso"] = time.time()
+            _stats["hits"] += 1
+            _salvar_indice()
+            return entrada["arquivo"]
+        if entrada:
+            # Arquivo sumiu do disco
+            del indice[chave]
+        _stats["misses"] += 1
+        return None
+
+def registrar(chave, prompt):
+    """Registra no índice uma imagem já salva em caminho_para(chave) e aplica o LRU."""
+    arquivo = caminho_para(chave)
+    with _lock:
+        indice = _carregar_indice()
+        indice[chave] = {
+            "arquivo": arquivo,
+            "prompt": prompt[:200],
+            "tamanho": os.path.getsize(arquivo),
+            "ultimo_acesso": time.time(),
+        }
+        _evictar(LIMITE_CACHE_MB * 1024 * 1024)
+        _salvar_indice()
+    return arquivo
+
+def _evictar(limite_bytes):
+    # Remove as menos usadas recentemente até caber no limite (chamado com o lock)
+    total = sum(e["tamanho"] for e in _indice.values())
+    if total <= limite_bytes: return
+    for chave, entrada in sorted(_indice.items(), key=lambda kv: kv[1]["ultimo_acesso"]):
+        if total <= limite_bytes: break
+        try:
+            os.remove(entrada["arquivo"])
+        except OSError:
+            pass
+        total -= entrada["tamanho"]
+        del _indice[chave]
+        _stats["evictions"] += 1
+
+def estatisticas():
+    with _lock:
+        indice = _carregar_indice()
+        return {
+            **_stats,
+            "itens": len(indice),
+            "tamanho_mb": round(sum(e["tamanho"] for e in indice.values()) / (1024 * 1024), 1),
+        }
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- CACHE PERSISTENTE DE RESPOSTAS DO LLM ---
+# Opt-in: desligado por padrão. Liga com ativar() (ou LLM_CACHE=1 no ambiente).
+# Chave = sha256(modelo + prompt + config). Guardado em SQLite em temp/.
+
+ARQUIVO_DB = "temp/cache_llm.sqlite"
+
+CONFIG = {
+    "ativo": os.environ.get("LLM_CACHE", "0") == "1",
+    "ttl_segundos": 7 * 24 * 3600,
+    "limite_mb": 200,
+    # Por agente: None = segue o "ativo" global; True/False força
+    "agentes": {},
+    # Tradução por capítulo (chave = hash do trecho original); ligado por padrão
+    "traducoes": True,
+}
+
+# Escolha da sessão/job (None = segue CONFIG). Por contexto, não global: o toggle de
+# um usuário não muda o cache das outras sessões nem dos jobs em segundo plano.
+_preferencia = contextvars.ContextVar("cache_llm_preferencia", default=None)
+
+_lock = threading.Lock()
+_conn = None
+_stats = {"hits": 0, "misses": 0, "gravados": 0, "expirados": 0, "evictions": 0}
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(ARQUIVO_DB), exist_ok=True)
+        _conn = sqlite3.connect(ARQUIVO_DB, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS respostas (
+                chave TEXT PRIMARY KEY,
+                agente TEXT,
+                resposta TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_acesso ON respostas(ultimo_acesso)")
+        _conn.commit()
+    return _conn
+
+def ativar(ligado=True, agentes=None, ttl_segundos=None, limite_mb=None):
+    CONFIG["ativo"] = ligado
+    if agentes is not None: CONFIG["agentes"].update(agentes)
+    if ttl_segundos is not None: CONFIG["ttl_segundos"] = ttl_segundos
+    if limite_mb is not None: CONFIG["limite_mb"] = limite_mb
+
+def definir_preferencia(ligado):
+    """Preferência da execução atual (ex.: um rerun do Streamlit). None volta ao CONFIG."""
+    _preferencia.set(ligado)
+
+@contextmanager
+def preferencia(ligado):
+    token = _preferencia.set(ligado)
+    try:
+        yield
+    finally:
+        _preferencia.reset(token)
+
+def habilitado(agente=None):
+    por_agente = CONFIG["agentes"].get(agente)
+    if por_agente is not None: return por_agente
+    escolha = _preferencia.get()
+    if escolha is not None: return escolha
+    return CONFIG["ativo"]
+
+def chave_resposta(modelo, prompt, config):
+    base = json.dumps([modelo, prompt, config], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+def chave_traducao(modelo, texto_origem):
+    """Chave por conteúdo do trecho: editar um capítulo só invalida a tradução dele."""
+    return "traducao:" + chave_resposta(modelo, texto_origem.strip(), {})
+
+def buscar(chave):
+    agora = time.time()
+    with _lock:
+        db = _db()
+        linha = db.execute("SELECT resposta, criado_em FROM respostas WHERE chave = ?", (chave,)).fetchone()
+        if not linha:
+            _stats["misses"] += 1
+            return None
+        resposta, criado_em = linha
+        if agora - criado_em > CONFIG["ttl_segundos"]:
+            db.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+            db.commit()
+            _stats["expirados"] += 1
+            _stats["misses"] += 1
+            return None
+        db.execute("UPDATE respostas SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+        db.commit()
+        _stats["hits"] += 1
+        return resposta
+
+def gravar(chave, resposta, agente=None):
+    agora = time.time()
+    tamanho = len(resposta.encode("utf-8"))
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?, ?)",
+            (chave, agente, resposta, tamanho, agora, agora)
+        )
+        _stats["gravados"] += 1
+        _evictar(db, CONFIG["limite_mb"] * 1024 * 1024)
+        db.commit()
+
+def _evictar(db, limite_bytes):
+    # LRU: apaga as menos acessadas até caber no limite (chamado com o lock)
+    total = db.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+    if total <= limite_bytes: return
+    for chave, tamanho in db.execute("SELECT chave, tamanho FROM respostas ORDER BY ultimo_acesso").fetchall():
+        if total <= limite_bytes: break
+        db.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+        total -= tamanho
+        _stats["evictions"] += 1
+
+def limpar():
+    with _lock:
+        db = _db()
+        db.execute("DELETE FROM respostas")
+        db.commit()
+
+def estatisticas():
+    with _lock:
+        itens, total = _db().execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()
+        consultas = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "itens": itens,
+            "tamanho_mb": round(total / (1024 * 1024), 2),
+            "hit_rate": round(_stats["hits"] / consultas, 3) if consultas else 0.0,
+        }
@@ -0,0 +1,99 @@
+import re
+from collections import Counter
+
+# --- CONTEXTO ROLANTE DO ESCRITOR ---
+# Em vez de reenviar todos os resumos (que só crescem), o escritor recebe:
+# - os últimos capítulos resumidos por inteiro;
+# - os mais antigos comprimidos (só a 1ª frase de cada);
+# - personagens/lugares citados e pontas soltas ainda abertas;
+# tudo dentro de um orçamento de tokens fixo.
+
+ORCAMENTO_TOKENS = 600
+ORCAMENTO_SINOPSE = 250
+CAPITULOS_RECENTES = 2
+
+PISTAS_PONTAS_SOLTAS = (
+    "?", "mystery", "unknown", "secret", "missing", "must", "will ", "plan", "search",
+    "hidden", "promise", "threat", "unanswered", "why", "who ",
+)
+NAO_ENTIDADES = set("""
+The A An And But Or If When While After Before As At In On Of To For With From By Meanwhile Then
+He She They It His Her Their We I You Chapter Start
+This That These Those There Here Now Later Soon Suddenly Inside Outside Finally Still Yet
+Once Only Even Back Down Up Out Over Under Through Across Around Without Despite Instead
+Nothing Something Everyone Someone No Not Yes Its Our Your Them Him Me Us Who What Where Why How
+""".split())
+
+def estimar_tokens(texto):
+    """Estimativa barata (~4 caracteres por token), suficiente para orçamento."""
+    return (len(texto or "") + 3) // 4
+
+def _frases(texto):
+    return [f.strip() for f in re.split(r'(?<=[.!?])\s+', texto or "") if f.strip()]
+
+def _cortar_em_tokens(texto, limite):
+    """Mantém frases inteiras até o limite de tokens."""
+    saida = ""
+    for frase in _frases(texto):
+        if estimar_tokens(f"{saida} {frase}") > limite: break
+        saida = f"{saida} {frase}".strip()
+    return saida or texto[:limite * 4]
+
+class ContextoHistoria:
+    def __init__(self, sinopse, orcamento_tokens=ORCAMENTO_TOKENS,
+                 orcamento_sinopse=ORCAMENTO_SINOPSE, recentes=CAPITULOS_RECENTES):
+        self.sinopse = sinopse
+        self.orcamento = orcamento_tokens
+        self.recentes = recentes
+        self.sinopse_compacta = _cortar_em_tokens(sinopse, orcamento_sinopse)
+        self.resumos = []     # [(titulo, resumo)]
+        self.entidades = Counter()
+        self.tamanhos = []    # tokens estimados do prompt de cada capítulo
+
+    def adicionar(self, titulo, resumo):
+        self.resumos.append((titulo, resumo))
+        for frase in _frases(resumo):
+            # Palavras com maiúscula = nomes próprios; a 1ª da frase também conta
+            # (quem abre a frase costuma ser o protagonista), o NAO_ENTIDADES barra "The", "When"...
+            for nome in re.findall(r"[A-Za-z][\w'-]*", frase):
+                if nome[0].isupper() and len(nome) > 2 and nome not in NAO_ENTIDADES:
+                    self.entidades[nome] += 1
+
+    def _pontas_soltas(self, antigos):
+        pontas = [f for _, r in antigos for f in _frases(r) if any(p in f.lower() for p in PISTAS_PONTAS_SOLTAS)]
+        return list(dict.fromkeys(pontas))[-3:]
+
+    def texto(self):
+        """Contexto para o próximo capítulo, respeitando o orçamento."""
+        if not self.resumos: return "Start."
+        antigos = self.resumos[:-self.recentes] if len(self.resumos) > self.recentes else []
+        recentes = self.resumos[-self.recentes:]
+
+        blocos_recentes = [f"[{t}] {r}" for t, r in recentes]
+        entidades = ", ".join(n for n, _ in self.entidades.most_common(12))
+        pontas = self._pontas_soltas(antigos)
+        comprimidos = [f"[{t}] {(_frases(r) or [r])[0]}" for t, r in antigos]
+
+        def montar():
+            partes = []
+            if comprimidos: partes.append("EARLIER: " + " ".join(comprimidos))
+            if pontas: partes.append("OPEN THREADS: " + " ".join(pontas))
+            if entidades: partes.append(f"CHARACTERS/PLACES: {entidades}")
+            partes.append("RECENT: " + "\n".join(blocos_recentes))
+            return "\n".join(partes)
+
+        # Corta do mais antigo para o mais novo até caber
+        texto = montar()
+        while estimar_tokens(texto) > self.orcamento and (comprimidos or pontas):
+            if comprimidos: comprimidos.pop(0)
+            else: pontas.pop(0)
+            texto = montar()
+        if estimar_tokens(texto) > self.orcamento:
+            texto = texto[-self.orcamento * 4:]
+        return texto
+
+    def registrar_prompt(self, *partes):
+        self.tamanhos.append(sum(estimar_tokens(p) for p in partes))
+
+    def relatorio(self):
+        return [{"capitulo": i + 1, "tokens_prompt": t} for i, t in enumerate(self.tamanhos)]
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# --- FILA DE TRABALHOS EM SEGUNDO PLANO ---
+# Rascunhos e renderizações rodam num pool de workers do processo, fora da
+# thread do Streamlit: reruns, cliques e desconexões não matam o trabalho.
+# O estado fica numa tabela SQLite, então qualquer sessão pode acompanhar.
+
+ARQUIVO_DB = "temp/jobs.sqlite"
+MAX_WORKERS = int(os.environ.get("JOBS_WORKERS", "3"))
+
+PENDENTE, RODANDO, CONCLUIDO, ERRO = "pendente", "rodando", "concluido", "erro"
+
+_lock = threading.Lock()
+_conn = None
+_executor = None
+_handlers = {}
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(ARQUIVO_DB), exist_ok=True)
+        _conn = sqlite3.connect(ARQUIVO_DB, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                titulo TEXT,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progresso REAL DEFAULT 0,
+                mensagem TEXT DEFAULT '',
+                resultado TEXT,
+                criado_em REAL NOT NULL,
+                atualizado_em REAL NOT NULL
+            )
+        """)
+        # Jobs que estavam rodando quando o processo caiu não vão terminar
+        _conn.execute(
+            "UPDATE jobs SET status = ?, mensagem = 'Interrompido (app reiniciado)' WHERE status IN (?, ?)",
+            (ERRO, PENDENTE, RODANDO)
+        )
+        _conn.commit()
+    return _conn
+
+def _atualizar(job_id, **campos):
+    campos["atualizado_em"] = time.time()
+    if "resultado" in campos: campos["resultado"] = json.dumps(campos["resultado"], default=str)
+    sets = ", ".join(f"{k} = ?" for k in campos)
+    with _lock:
+        db = _db()
+        db.execute(f"UPDATE jobs SET {sets} WHERE id = ?", (*campos.values(), job_id))
+        db.commit()
+
+def registrar(tipo):
+    """Decorator: registra a função que executa jobs do `tipo`. Assinatura: (params, progresso)."""
+    def decorar(func):
+        _handlers[tipo] = func
+        return func
+    return decorar
+
+def _executar(job_id, tipo, params):
+    _atualizar(job_id, status=RODANDO, mensagem="Iniciando...")
+
+    def progresso(fracao, mensagem=""):
+        _atualizar(job_id, progresso=float(fracao), mensagem=mensagem)
+
+    try:
+        resultado = _handlers[tipo](params, progresso)
+        _atualizar(job_id, status=CONCLUIDO, progresso=1.0, mensagem="Pronto!", resultado=resultado)
+    except Exception as e:
+        traceback.print_exc()
+        _atualizar(job_id, status=ERRO, mensagem=f"{type(e).__name__}: {e}")
+
+def enfileirar(tipo, params, titulo=""):
+    """Coloca um job na fila e retorna o id."""
+    global _executor
+    if tipo not in _handlers: raise ValueError(f"Tipo de job desconhecido: {tipo}")
+    job_id = uuid.uuid4().hex[:12]
+    agora = time.time()
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT INTO jobs (id, tipo, titulo, params, status, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, tipo, titulo, json.dumps(params, default=str), PENDENTE, agora, agora)
+        )
+        db.commit()
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+    _executor.submit(_executar, job_id, tipo, params)
+    return job_id
+
+def _linha_para_dict(linha):
+    chaves = ["id", "tipo", "titulo", "params", "status", "progresso", "mensagem", "resultado", "criado_em", "atualizado_em"]
+    job = dict(zip(chaves, linha))
+    job["params"] = json.loads(job["params"])
+    job["resultado"] = json.loads(job["resultado"]) if job["resultado"] else None
+    return job
+
+def consultar(job_id):
+    with _lock:
+        linha = _db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _linha_para_dict(linha) if linha else None
+
+def listar(tipo=None, limite=20):
+    with _lock:
+        if tipo:
+            linhas = _db().execute("SELECT * FROM jobs WHERE tipo = ? ORDER BY criado_em DESC LIMIT ?", (tipo, limite)).fetchall()
+        else:
+            linhas = _db().execute("SELECT * FROM jobs ORDER BY criado_em DESC LIMIT ?", (limite,)).fetchall()
+    return [_linha_para_dict(l) for l in linhas]
+
+def ha_ativos(tipo=None):
+    """True se há job pendente ou rodando (a interface só faz polling nesse caso)."""
+    with _lock:
+        if tipo:
+            linha = _db().execute("SELECT COUNT(*) FROM jobs WHERE tipo = ? AND status IN (?, ?)", (tipo, PENDENTE, RODANDO)).fetchone()
+        else:
+            linha = _db().execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (PENDENTE, RODANDO)).fetchone()
+    return linha[0] > 0
+
+# --- TIPOS DE JOB ---
+@registrar("rascunho")
+def _job_rascunho(params, progresso):
+    import agentes_escrita, cache_llm
+    with cache_llm.preferencia(params.get("cache_llm")):
+        return agentes_escrita.gerar_rascunho(
+            params["tema"], params["nicho"], params["generos"],
+            ao_progredir=progresso, modo=params.get("modo", "sequencial"),
+            orcamento_contexto=params.get("orcamento_contexto")
+        )
+
+@registrar("render")
+def _job_render(params, progresso):
+    import agentes_producao
+    progresso(0.05, f"Renderizando ({params.get('backend', 'moviepy')})...")
+    video = agentes_producao.renderizar_video_com_imagens(
+        params["audio"], params["imagens"], params["idioma"],
+        backend=params.get("backend", "moviepy"),
+        output=params.get("output"),
+        duracoes_cenas=params.get("duracoes_cenas")
+    )
+    if not video: raise RuntimeError("Renderizador retornou None.")
+    return {"video": video}
@@ -0,0 +1,132 @@
+import re
+import time
+import random
+import threading
+
+# --- LIMITADOR ADAPTATIVO (TOKEN BUCKET + AIMD) ---
+# Um limitador por modelo/API, compartilhado por todas as threads do processo.
+# - Token bucket: no máximo `taxa` chamadas por segundo.
+# - AIMD: a concorrência sobe devagar a cada sucesso e cai pela metade a cada
+#   429/5xx, então o paralelismo se ajusta sozinho à cota real.
+# - Erros de cota/servidor são refeitos com backoff exponencial com jitter.
+
+TENTATIVAS = 6
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+
+# Configuração inicial por chave (ajustável com configurar())
+PADROES = {
+    "texto": {"taxa": 2.0, "taxa_max": 10.0, "concorrencia": 4, "concorrencia_max": 16},
+    "imagem": {"taxa": 0.5, "taxa_max": 2.0, "concorrencia": 2, "concorrencia_max": 8},
+}
+
+RE_ERRO_RETENTAVEL = re.compile(r"\b(429|50[0234]|RESOURCE_EXHAUSTED|UNAVAILABLE|INTERNAL)\b")
+
+def erro_retentavel(e):
+    """429 (cota) e 5xx (servidor) valem nova tentativa; o resto é erro de verdade."""
+    codigo = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if isinstance(codigo, int):
+        return codigo == 429 or 500 <= codigo < 600
+    # Sem código no objeto: procura status inteiros no texto ("1500 tokens" não é 500)
+    return bool(RE_ERRO_RETENTAVEL.search(str(e)))
+
+class LimitadorAdaptativo:
+    def __init__(self, nome, taxa, taxa_max, concorrencia, concorrencia_max):
+        self.nome = nome
+        self.taxa = float(taxa)
+        self.taxa_base = float(taxa)
+        self.taxa_min = min(0.05, self.taxa)
+        self.taxa_max = float(taxa_max)
+        self.limite = float(concorrencia)
+        self.limite_max = float(concorrencia_max)
+        self.em_voo = 0
+        self._tokens = 1.0
+        self._ultimo = time.monotonic()
+        self._ultimo_corte = 0.0
+        self._cond = threading.Condition()
+        self.stats = {"chamadas": 0, "throttles": 0, "retentativas": 0, "falhas": 0}
+
+    def _repor_tokens(self):
+        agora = time.monotonic()
+        self._tokens = min(max(1.0, self.taxa), self._tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def adquirir(self):
+        with self._cond:
+            while True:
+                self._repor_tokens()
+                if self.em_voo < int(self.limite) and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.em_voo += 1
+                    return
+                espera = (1 - self._tokens) / self.taxa if self._tokens < 1 else 0.05
+                self._cond.wait(timeout=max(0.01, espera))
+
+    def liberar(self):
+        with self._cond:
+            self.em_voo -= 1
+            self._cond.notify_all()
+
+    def sucesso(self):
+        # Aumento aditivo: +1 vaga a cada `limite` sucessos, taxa +10% da inicial
+        with self._cond:
+            self.limite = min(self.limite_max, self.limite + 1 / max(self.limite, 1))
+            self.taxa = min(self.taxa_max, self.taxa + self.taxa_base / 10)
+            self._cond.notify_all()
+
+    def throttle(self):
+        # Redução multiplicativa, no máximo uma por segundo: vários 429 da
+        # mesma rajada (chamadas já em voo) contam como um evento só
+        with self._cond:
+            self.stats["throttles"] += 1
+            agora = time.monotonic()
+            if agora - self._ultimo_corte < 1.0: return
+            self._ultimo_corte = agora
+            self.limite = max(1.0, self.limite / 2)
+            self.taxa = max(self.taxa_min, self.taxa / 2)
+
+    def executar(self, func, *args, **kwargs):
+        """Chama func respeitando o limite; refaz em 429/5xx com backoff e jitter."""
+        for tentativa in range(TENTATIVAS):
+            self.adquirir()
+            try:
+                self.stats["chamadas"] += 1
+                resultado = func(*args, **kwargs)
+            except Exception as e:
+                if not erro_retentavel(e) or tentativa == TENTATIVAS - 1:
+                    self.stats["falhas"] += 1
+                    raise
+                self.throttle()
+                self.stats["retentativas"] += 1
+            else:
+                self.sucesso()
+                return resultado
+            finally:
+                self.liberar()
+            # Full jitter: espera aleatória até o teto exponencial
+            atraso = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** tentativa))
+            print(f"⏳ {self.nome}: limite atingido, nova tentativa em {atraso:.1f}s")
+            time.sleep(atraso)
+
+    def estado(self):
+        with self._cond:
+            return {"taxa": round(self.taxa, 2), "concorrencia": int(self.limite), "em_voo": self.em_voo, **self.stats}
+
+_lock = threading.Lock()
+_limitadores = {}
+
+def obter(api, modelo):
+    """Limitador compartilhado para (api, modelo). api: "texto" ou "imagem"."""
+    chave = f"{api}:{modelo}"
+    with _lock:
+        if chave not in _limitadores:
+            _limitadores[chave] = LimitadorAdaptativo(chave, **PADROES.get(api, PADROES["texto"]))
+        return _limitadores[chave]
+
+def configurar(api, **valores):
+    """Altera os padrões de uma API (vale para limitadores criados depois)."""
+    PADROES.setdefault(api, dict(PADROES["texto"])).update(valores)
+
+def estado_geral():
+    with _lock:
+        return {chave: lim.estado() for chave, lim in _limitadores.items()}
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- MÉTRICAS E RASTREAMENTO ---
+# Cada chamada instrumentada vira um "span" (operação + duração + atributos),
+# gravado em JSON lines e somado em contadores no formato texto do Prometheus.
+# Spans com `modelo` ganham custo_usd pela tabela PRECOS.
+
+ARQUIVO_JSONL = "temp/metricas.jsonl"
+LIMITE_JSONL_MB = float(os.environ.get("METRICAS_LIMITE_MB", "20"))  # passou disso, vira .1 e recomeça
+BLOCO_LEITURA = 64 * 1024
+PORTA_PROMETHEUS = int(os.environ.get("METRICAS_PORTA", "9108"))
+HOST_PROMETHEUS = os.environ.get("METRICAS_HOST", "127.0.0.1")  # endpoint sem autenticação: só local
+
+# Preços em USD (tabela pública; ajuste aqui quando mudar)
+PRECOS = {
+    "gemini-1.5-flash": {"tokens_prompt": 0.075 / 1e6, "tokens_resposta": 0.30 / 1e6},
+    "imagen-4.0-fast-generate-001": {"imagens": 0.02},
+    "edge-tts": {"chars_tts": 0.0},  # serviço gratuito; mantido para trocar de TTS sem mexer no código
+}
+
+# Atributos numéricos que viram contadores (somados por operação)
+CONTADORES = ["tokens_prompt", "tokens_resposta", "imagens", "bytes", "frames", "segundos_audio", "custo_usd"]
+
+_lock = threading.Lock()
+_contagem = defaultdict(int)
+_duracao = defaultdict(float)
+_somas = defaultdict(float)
+_estagio = contextvars.ContextVar("estagio", default=None)
+_servidor = None
+
+def _estagio_atual():
+    return _estagio.get()
+
+@contextmanager
+def estagio(nome):
+    """Agrupa os spans deste contexto num estágio (ex: "rascunho", "render")."""
+    token = _estagio.set(nome)
+    try:
+        with span(f"estagio_{nome}"):
+            yield
+    finally:
+        _estagio.reset(token)
+
+def propagar(func):
+    """
+    Captura o contexto atual (estágio, preferência de cache da sessão) para uso em
+    outra thread (pools não herdam o contexto): executor.submit(metricas.propagar(func), ...).
+    """
+    contexto = contextvars.copy_context()
+    def executar(*args, **kwargs):
+        # Cópia por chamada: executor.map roda o mesmo wrapper em várias threads
+        return contexto.copy().run(func, *args, **kwargs)
+    return executar
+
+def custo(attrs):
+    """Custo em USD do span, pelos preços do modelo (0 se o modelo não está na tabela)."""
+    precos = PRECOS.get(attrs.get("modelo"), {})
+    return sum(
+        attrs[chave] * preco for chave, preco in precos.items()
+        if isinstance(attrs.get(chave), (int, float))
+    )
+
+@contextmanager
+def span(operacao, **atributos):
+    """
+    Mede uma operação. O bloco pode preencher o dict devolvido com atributos
+    extras (tokens, bytes, etc.). Exceções são registradas e repassadas.
+    """
+    attrs = dict(atributos)
+    inicio = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["erro"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        registrar(operacao, time.perf_counter() - t0, inicio, attrs)
+
+def registrar(operacao, duracao_s, inicio, attrs):
+    if attrs.get("frames") and duracao_s > 0:
+        attrs["fps_render"] = round(attrs["frames"] / duracao_s, 1)
+    if "modelo" in attrs and "custo_usd" not in attrs:
+        attrs["custo_usd"] = round(custo(attrs), 6)
+    evento = {
+        "id": uuid.uuid4().hex[:12], "op": operacao, "estagio": _estagio_atual(),
+        "inicio": round(inicio, 3), "duracao_s": round(duracao_s, 4), **attrs,
+    }
+    with _lock:
+        _contagem[operacao] += 1
+        _duracao[operacao] += duracao_s
+        if "erro" in attrs: _contagem[(operacao, "erro")] += 1
+        for chave in CONTADORES:
+            valor = attrs.get(chave)
+            if isinstance(valor, (int, float)): _somas[(operacao, chave)] += valor
+        try:
+            os.makedirs(os.path.dirname(ARQUIVO_JSONL), exist_ok=True)
+            with open(ARQUIVO_JSONL, "a", encoding="utf-8") as f:
+                f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+                tamanho = f.tell()
+            # Rotação simples: guarda só o arquivo anterior
+            if tamanho > LIMITE_JSONL_MB * 1024 * 1024:
+                os.replace(ARQUIVO_JSONL, ARQUIVO_JSONL + ".1")
+        except OSError as e:
+            print(f"Métricas: não foi possível gravar ({e})")
+
+def uso_tokens(response):
+    """Extrai (prompt, resposta) do usage_metadata da resposta do GenAI, se houver."""
+    uso = getattr(response, "usage_metadata", None)
+    if not uso: return {}
+    return {
+        "tokens_prompt": getattr(uso, "prompt_token_count", None) or 0,
+        "tokens_resposta": getattr(uso, "candidates_token_count", None) or 0,
+    }
+
+def texto_prometheus():
+    linhas = []
+    with _lock:
+        ops = sorted(k for k in _contagem if isinstance(k, str))
+        series = [
+            ("historia_operacoes_total", lambda op: _contagem[op]),
+            ("historia_operacoes_erros_total", lambda op: _contagem.get((op, "erro"), 0)),
+            ("historia_duracao_segundos_total", lambda op: round(_duracao[op], 4)),
+        ]
+        for nome, valor in series:
+            linhas.append(f"# TYPE {nome} counter")
+            linhas += [f'{nome}{{op="{op}"}} {valor(op)}' for op in ops]
+        for chave in CONTADORES:
+            linhas.append(f"# TYPE historia_{chave}_total counter")
+            for (op, c), valor in sorted(_somas.items()):
+                if c == chave: linhas.append(f'historia_{chave}_total{{op="{op}"}} {valor:g}')
+    return "\n".join(linhas) + "\n"
+
+def _ultimas_linhas(caminho, limite):
+    """Lê o arquivo de trás para frente, em blocos, só até juntar `limite` linhas."""
+    with open(caminho, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        posicao, dados = f.tell(), b""
+        while posicao > 0 and dados.count(b"\n") <= limite:
+            passo = min(BLOCO_LEITURA, posicao)
+            posicao -= passo
+            f.seek(posicao)
+            dados = f.read(passo) + dados
+    linhas = dados.decode("utf-8", errors="replace").splitlines()
+    # Sem chegar ao início, a primeira linha pode estar cortada ao meio
+    return linhas[-limite:] if posicao == 0 else linhas[1:][-limite:]
+
+def ultimos_eventos(limite=200):
+    linhas = _ultimas_linhas(ARQUIVO_JSONL, limite) if os.path.exists(ARQUIVO_JSONL) else []
+    # Logo depois de uma rotação, completa com o fim do arquivo anterior
+    if len(linhas) < limite and os.path.exists(ARQUIVO_JSONL + ".1"):
+        linhas = _ultimas_linhas(ARQUIVO_JSONL + ".1", limite - len(linhas)) + linhas
+    eventos = []
+    for l in linhas:
+        try: eventos.append(json.loads(l))
+        except ValueError: continue
+    return eventos
+
+class _HandlerMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        corpo = texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+def iniciar_servidor(porta=PORTA_PROMETHEUS, host=HOST_PROMETHEUS):
+    """Sobe (uma vez por processo) o endpoint /metrics em segundo plano (só localhost por padrão)."""
+    global _servidor
+    with _lock:
+        if _servidor is not None: return _servidor
+        try:
+            _servidor = ThreadingHTTPServer((host, porta), _HandlerMetricas)
+        except OSError as e:
+            print(f"Endpoint de métricas não iniciou na porta {porta}: {e}")
+            return None
+    threading.Thread(target=_servidor.serve_forever, daemon=True, name="metricas").start()
+    return _servidor
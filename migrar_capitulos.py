@@ -0,0 +1,15 @@
+"""
+Migração única para o layout de capítulos.
+Uso: python migrar_capitulos.py [historia_id]
+(lê as credenciais de .streamlit/secrets.toml, como o app)
+"""
+import sys
+import utils
+
+if __name__ == "__main__":
+    if not utils.setup_api():
+        print("Erro ao conectar no Firebase. Verifique o secrets.toml")
+        sys.exit(1)
+    historia_id = sys.argv[1] if len(sys.argv) > 1 else None
+    total = utils.migrar_para_capitulos(historia_id)
+    print(f"✅ {total} história(s) migrada(s) para a subcoleção 'capitulos'.")
@@ -1,5 +1,7 @@
 import streamlit as st
 import utils
+import busca
+import cache_biblioteca
 from firebase_admin import firestore
 import pandas as pd
 from datetime import datetime
@@ -19,40 +21,31 @@ if not utils.setup_api():
     st.stop()
 
 # --- BUSCA DE DADOS ---
+ITENS_POR_PAGINA = 20
+
+# Cache compartilhado entre sessões, mantido por um listener do Firestore.
+# Se o listener não subir (ou cair), cai para a consulta paginada no servidor.
+try:
+    cache_bib = cache_biblioteca.obter_cache_ativo()
+except Exception as e:
+    print(f"Listener da biblioteca indisponível: {e}")
+    cache_bib = None
+
 @st.cache_data(ttl=5) # Cache curto para atualização rápida
-def carregar_historias():
+def carregar_historias(status, cursor):
+    # Só os campos da listagem; roteiros completos vêm sob demanda
     try:
-        db = firestore.client()
-        # Tenta ordenar por data (requer índice no Firebase na primeira vez)
-        try:
-            docs = db.collection("historias").order_by("data_criacao", direction=firestore.Query.DESCENDING).stream()
-        except:
-            # Fallback se não tiver índice ainda
-            docs = db.collection("historias").stream()
-        
-        lista_historias = []
-        for doc in docs:
-            dado = doc.to_dict()
-            dado['id'] = doc.id
-            lista_historias.append(dado)
-            
-        return lista_historias
+        return utils.listar_historias(status, ITENS_POR_PAGINA, cursor)
     except Exception as e:
         st.error(f"Erro ao baixar histórias: {e}")
-        return []
-
-historias = carregar_historias()
-
-if not historias:
-    st.info("Nenhuma história encontrada no banco de dados.")
-    st.stop()
+        return [], None
 
 # --- FILTROS ---
 with st.container(border=True):
     col_search, col_status, col_refresh = st.columns([3, 2, 1])
     
     with col_search:
-        termo_busca = st.text_input("🔍 Buscar:", placeholder="Título, tema ou sinopse...")
+        termo_busca = st.text_input("🔍 Buscar:", placeholder="Tema, sinopse ou trecho do roteiro...")
         
     with col_status:
         filtro_status = st.selectbox(
@@ -65,26 +58,83 @@ with st.container(border=True):
         if st.button("🔄 Atualizar"):
             carregar_historias.clear()
             st.rerun()
+        if cache_bib:
+            st.caption(f"⚡ Tempo real · {cache_bib.deltas_aplicados} deltas")
+
+# --- PAGINAÇÃO (CURSOR) ---
+# Guarda o cursor de início de cada página visitada; muda o filtro ou a fonte -> volta p/ página 1
+# (cache em memória usa nº de página, o servidor usa (data_criacao, id): não se misturam)
+fonte = "cache" if cache_bib else "servidor"
+if st.session_state.get('bib_filtro') != (filtro_status, fonte):
+    st.session_state['bib_filtro'] = (filtro_status, fonte)
+    st.session_state['bib_cursores'] = [None]
+cursores = st.session_state['bib_cursores']
+
+# Com termo de busca, o índice local responde (sem baixar a coleção)
+if termo_busca:
+    indice = busca.obter_indice()
+    if not cache_bib:
+        # Sem listener, o índice puxa os deltas sob demanda
+        try:
+            indice.sincronizar(firestore.client())
+        except Exception as e:
+            st.warning(f"Índice de busca não sincronizou (usando versão local): {e}")
+    historias = []
+    for doc_id, score, meta in indice.buscar(termo_busca):
+        if filtro_status != "Todos" and meta.get('status', 'Roteiro Pronto') != filtro_status:
+            continue
+        historias.append({**meta, 'id': doc_id})
+    proximo_cursor = None
+elif cache_bib:
+    # Páginas em memória: o "cursor" é o número da próxima página
+    pagina = len(cursores) - 1
+    historias, tem_mais = cache_bib.listar(filtro_status, pagina, ITENS_POR_PAGINA)
+    proximo_cursor = pagina + 1 if tem_mais else None
+else:
+    historias, proximo_cursor = carregar_historias(filtro_status, cursores[-1])
+
+col_ant, col_pag, col_prox = st.columns([1, 2, 1])
+with col_ant:
+    if st.button("⬅️ Anterior", disabled=len(cursores) == 1):
+        cursores.pop()
+        st.rerun()
+with col_pag:
+    st.caption(f"Página {len(cursores)}")
+with col_prox:
+    if st.button("Próxima ➡️", disabled=proximo_cursor is None):
+        cursores.append(proximo_cursor)
+        st.rerun()
+
+if not historias:
+    st.info("Nenhuma história encontrada no banco de dados.")
+    st.stop()
+
+# --- STATUS EM LOTE ---
+with st.expander("🗂️ Alterar status em lote"):
+    opcoes = {h['id']: h.get('tema', 'Sem Título') for h in historias}
+    selecionadas = st.multiselect("Histórias desta página:", list(opcoes), format_func=lambda i: opcoes[i])
+    col_l1, col_l2 = st.columns(2)
+    with col_l1:
+        if st.button("⬇️ Marcar Baixadas", disabled=not selecionadas):
+            utils.atualizar_status_em_lote(selecionadas, "Aguardando Postagem")
+            carregar_historias.clear()
+            st.rerun()
+    with col_l2:
+        if st.button("✅ Marcar Postadas", disabled=not selecionadas):
+            utils.atualizar_status_em_lote(selecionadas, "Postado")
+            carregar_historias.clear()
+            st.rerun()
+
+@st.cache_data(ttl=60)
+def carregar_completa(historia_id):
+    return utils.carregar_historia_completa(historia_id)
 
 # --- SEPARAÇÃO ---
 lista_biblia = []
 lista_geral = []
 
 for item in historias:
-    # 1. Filtro de Texto
-    if termo_busca:
-        termo = termo_busca.lower()
-        tema = item.get('tema', '').lower()
-        sinopse = item.get('sinopse', '').lower()
-        if termo not in tema and termo not in sinopse:
-            continue
-
-    # 2. Filtro de Status
-    status_item = item.get('status', 'Roteiro Pronto')
-    if filtro_status != "Todos" and status_item != filtro_status:
-        continue
-
-    # 3. Separação por Nicho
+    # Separação por Nicho (texto e status já filtrados)
     nicho = item.get('nicho', 'Outros')
     if "Bible" in nicho or "Bíblia" in nicho or "Biblicas" in nicho:
         lista_biblia.append(item)
@@ -113,11 +163,12 @@ def exibir_lista(lista_items):
             # --- BOTÃO MÁGICO DE CARREGAR ---
             st.info("💡 **Produção:**")
             if st.button(f"🎬 Carregar no Estúdio", key=f"load_{hist['id']}", type="primary"):
+                completa = carregar_completa(hist['id']) or hist
                 # 1. Carrega os Dados Principais
-                st.session_state['texto_completo_pt'] = hist.get('roteiro_pt')
-                st.session_state['texto_completo_en'] = hist.get('roteiro_en')
-                st.session_state['tema_atual'] = hist.get('tema')
-                st.session_state['prompts_visuais'] = hist.get('prompts', [])
+                st.session_state['texto_completo_pt'] = completa.get('roteiro_pt')
+                st.session_state['texto_completo_en'] = completa.get('roteiro_en')
+                st.session_state['tema_atual'] = completa.get('tema')
+                st.session_state['prompts_visuais'] = completa.get('prompts', [])
                 
                 # 2. LIMPEZA DE SESSÃO (IMPORTANTE PARA O NOVO FLUXO)
                 # Reseta caminhos de arquivos antigos
@@ -132,19 +183,26 @@ def exibir_lista(lista_items):
 
             st.divider()
 
-            # Visualização Rápida
-            t_sinopse, t_pt, t_en, t_prompts = st.tabs(["📝 Sinopse", "🇧🇷 PT", "🇺🇸 EN", "🎨 Prompts"])
-            
-            with t_sinopse: st.write(hist.get('sinopse', '...'))
-            with t_pt: st.text_area("PT", hist.get('roteiro_pt', ''), height=150, key=f"pt_{hist['id']}")
-            with t_en: st.text_area("EN", hist.get('roteiro_en', ''), height=150, key=f"en_{hist['id']}")
-            with t_prompts: 
-                prompts = hist.get('prompts', [])
-                if prompts:
-                    for i, p in enumerate(prompts):
-                        st.text(f"{i+1}. {p}")
-                else:
-                    st.warning("Sem prompts salvos.")
+            # Visualização Rápida (roteiro completo só é baixado sob demanda)
+            abertas = st.session_state.setdefault('bib_abertas', set())
+            if hist['id'] not in abertas:
+                if st.button("📖 Abrir Roteiro", key=f"open_{hist['id']}"):
+                    abertas.add(hist['id'])
+                    st.rerun()
+            else:
+                completa = carregar_completa(hist['id']) or {}
+                t_sinopse, t_pt, t_en, t_prompts = st.tabs(["📝 Sinopse", "🇧🇷 PT", "🇺🇸 EN", "🎨 Prompts"])
+                
+                with t_sinopse: st.write(completa.get('sinopse', '...'))
+                with t_pt: st.text_area("PT", completa.get('roteiro_pt', ''), height=150, key=f"pt_{hist['id']}")
+                with t_en: st.text_area("EN", completa.get('roteiro_en', ''), height=150, key=f"en_{hist['id']}")
+                with t_prompts: 
+                    prompts = completa.get('prompts', [])
+                    if prompts:
+                        for i, p in enumerate(prompts):
+                            st.text(f"{i+1}. {p}")
+                    else:
+                        st.warning("Sem prompts salvos.")
 
             st.divider()
             
@@ -1,14 +1,12 @@
 import streamlit as st
 import utils
 import agentes_producao
+import cache_imagens
+import render_ffmpeg
+import jobs
+import metricas
 import os
-
-# --- CORREÇÃO DE IMPORT (MOVIEPY v2) ---
-try:
-    from moviepy.audio.io.AudioFileClip import AudioFileClip
-except ImportError:
-    from moviepy.editor import AudioFileClip
-# ---------------------------------------
+import time
 
 st.set_page_config(page_title="Estúdio", page_icon="🎬", layout="wide")
 if not utils.verificar_senha(): st.stop()
@@ -50,6 +48,9 @@ with col_config:
     modo_teste = st.checkbox("Ativar Modo Teste", value=True)
     if modo_teste:
         st.info("⚡ **Rápido:** Apenas Cap 1 (Texto) + 5 Imagens.")
+    
+    workers_imagens = st.slider("Imagens em paralelo", 1, 8, 4)
+    backend_render = st.selectbox("Motor de Renderização", agentes_producao.BACKENDS_RENDER)
 
 with col_status:
     st.subheader("🏭 Linha de Produção")
@@ -75,20 +76,31 @@ with col_status:
             with st.status("Produzindo...", expanded=True) as status:
                 st.write(f"🎙️ Gravando Texto PT ({len(texto_pt)} chars)...")
                 
-                path_pt = agentes_producao.gerar_audio(texto_pt, "pt", titulo_video)
-                st.session_state['caminhos_audio']['pt'] = path_pt
-                
-                if texto_en:
-                    path_en = agentes_producao.gerar_audio(texto_en, "en", titulo_video)
-                    st.session_state['caminhos_audio']['en'] = path_en
+                with metricas.estagio("audio"):
+                    path_pt, duracoes_pt = agentes_producao.gerar_audio_com_duracoes(texto_pt, "pt", titulo_video)
+                    st.session_state['caminhos_audio']['pt'] = path_pt
+                    # Narração por capítulo: cada cena dura o trecho do seu capítulo
+                    duracoes_capitulos = {"pt": agentes_producao.duracoes_por_capitulo(texto_pt, duracoes_pt)}
+                    
+                    if texto_en:
+                        path_en, duracoes_en = agentes_producao.gerar_audio_com_duracoes(texto_en, "en", titulo_video)
+                        st.session_state['caminhos_audio']['en'] = path_en
+                        duracoes_capitulos['en'] = agentes_producao.duracoes_por_capitulo(texto_en, duracoes_en)
                 
                 st.write(f"🎨 Pintando {len(prompts_para_usar)} cenas...")
-                lista_imgs = []
                 prog = st.progress(0)
-                for i, p in enumerate(prompts_para_usar):
-                    path = agentes_producao.gerar_imagem_ia(p, f"cena_{i}_{str(hash(p))[:8]}{suffix}")
-                    if path: lista_imgs.append(path)
-                    prog.progress((i+1)/len(prompts_para_usar))
+                nomes = [f"cena_{i}{suffix}" for i in range(len(prompts_para_usar))]
+                with metricas.estagio("imagens"):
+                    caminhos = agentes_producao.gerar_imagens_em_lote(
+                        prompts_para_usar, nomes, max_workers=workers_imagens,
+                        ao_concluir=lambda feitos, total: prog.progress(feitos/total)
+                    )
+                st.session_state['duracoes_cenas'] = {}
+                for idioma, duracoes in duracoes_capitulos.items():
+                    _, st.session_state['duracoes_cenas'][idioma] = agentes_producao.duracoes_por_cena(caminhos, duracoes)
+                lista_imgs = [c for c in caminhos if c]
+                stats = cache_imagens.estatisticas()
+                st.write(f"🗂️ Cache: {stats['hits']} reaproveitadas, {stats['misses']} novas ({stats['tamanho_mb']} MB)")
                 
                 st.session_state['caminhos_imagens'] = lista_imgs
                 status.update(label="Assets Prontos!", state="complete")
@@ -118,6 +130,7 @@ with col_status:
         path_audio = st.session_state['caminhos_audio']['pt']
         if st.button("2. Renderizar PT", disabled=not path_audio):
             with st.spinner("Renderizando..."):
+                inicio = time.time()
                 try:
                     if not st.session_state['caminhos_imagens']:
                         st.error("Sem imagens!")
@@ -126,26 +139,66 @@ with col_status:
                         audio_final = path_audio
                         if modo_teste:
                              try:
-                                clip = AudioFileClip(path_audio)
-                                duracao = min(len(st.session_state['caminhos_imagens']) * 6, clip.duration)
-                                # Em MoviePy v2 pode ser .with_duration ou subclipped
-                                # Tentando subclip padrão
-                                clip = clip.subclip(0, duracao)
-                                audio_final = "temp/audio_teste_cortado.mp3"
-                                clip.write_audiofile(audio_final)
+                                duracao = min(len(st.session_state['caminhos_imagens']) * 6, render_ffmpeg.duracao_midia(path_audio))
+                                audio_final = render_ffmpeg.cortar_audio(path_audio, "temp/audio_teste_cortado.mp3", duracao)
                              except Exception as e:
                                 st.warning(f"Não foi possível cortar áudio (usando completo): {e}")
 
                         v_pt = agentes_producao.renderizar_video_com_imagens(
                             audio_final, 
                             st.session_state['caminhos_imagens'], 
-                            "pt"
+                            "pt",
+                            backend=backend_render,
+                            duracoes_cenas=st.session_state.get('duracoes_cenas', {}).get('pt')
                         )
                         if v_pt:
-                            st.success("Sucesso!")
+                            st.success(f"Sucesso! ({backend_render}: {time.time() - inicio:.1f}s)")
+                            if backend_render == "segmentado":
+                                seg = render_ffmpeg.ultimo_render
+                                st.caption(f"🧩 Cenas reaproveitadas: {seg['reaproveitados']} · recodificadas: {seg['renderizados']}")
                             st.video(v_pt)
                             with open(v_pt, "rb") as f: st.download_button("⬇️ Baixar", f, "video_teste.mp4")
                         else:
                             st.error("Renderizador retornou None.")
                 except Exception as e:
                     st.error(f"ERRO FATAL: {e}")
+
+    with col_en:
+        audios = {k: v for k, v in st.session_state['caminhos_audio'].items() if v}
+        if st.button("⏳ Renderizar PT/EN em segundo plano", disabled=not audios or not st.session_state['caminhos_imagens']):
+            for idioma, audio in audios.items():
+                jobs.enfileirar("render", {
+                    "audio": audio, "imagens": st.session_state['caminhos_imagens'],
+                    "idioma": idioma, "backend": backend_render,
+                    "duracoes_cenas": st.session_state.get('duracoes_cenas', {}).get(idioma),
+                    "output": f"video_final_{idioma}_{int(time.time())}.mp4",
+                }, titulo=f"{titulo_video} ({idioma.upper()})")
+            st.toast("Renderização na fila!", icon="⏳")
+
+    # --- RENDERIZAÇÕES EM SEGUNDO PLANO ---
+    # Polling só enquanto há job ativo; quando todos terminam, um rerun completo desliga
+    acompanhando_renders = jobs.ha_ativos("render")
+
+    @st.fragment(run_every="3s" if acompanhando_renders else None)
+    def painel_renders():
+        lista_jobs = jobs.listar("render", limite=10)
+        if not lista_jobs: return
+        ativos = any(job['status'] in (jobs.PENDENTE, jobs.RODANDO) for job in lista_jobs)
+        if acompanhando_renders and not ativos: st.rerun()
+        with st.expander(f"⏳ Renderizações em segundo plano ({len(lista_jobs)})", expanded=True):
+            for job in lista_jobs:
+                st.caption(f"**{job['titulo']}** · {job['status']} · {job['mensagem']}")
+                if job['status'] in (jobs.PENDENTE, jobs.RODANDO):
+                    st.progress(job['progresso'])
+                elif job['status'] == jobs.CONCLUIDO and os.path.exists(job['resultado']['video']):
+                    # O arquivo só é lido quando o usuário pede o download
+                    chave_pronto = f"dl_pronto_{job['id']}"
+                    if not st.session_state.get(chave_pronto):
+                        if st.button("📦 Preparar download", key=f"prep_{job['id']}"):
+                            st.session_state[chave_pronto] = True
+                            st.rerun(scope="fragment")
+                    else:
+                        with open(job['resultado']['video'], "rb") as f:
+                            st.download_button("⬇️ Baixar", f, os.path.basename(job['resultado']['video']), key=f"dl_{job['id']}")
+
+    painel_renders()
@@ -1,6 +1,10 @@
 import streamlit as st
 import utils
 import agentes_escrita
+import cache_llm
+import jobs
+import metricas
+import contexto
 import pandas as pd
 import time
 
@@ -13,6 +17,18 @@ if not utils.setup_api():
 
 st.title("✍️ Roteirista Autônomo (Feedback Loop)")
 
+# --- CACHE DE RESPOSTAS (OPCIONAL) ---
+with st.sidebar:
+    st.markdown("#### 🗂️ Cache de Respostas")
+    # Só vale para esta sessão (e para os jobs que ela enfileira); o padrão global fica no CONFIG
+    usar_cache_llm = st.toggle("Reaproveitar respostas idênticas", value=cache_llm.CONFIG["ativo"], key="usar_cache_llm")
+    cache_llm.definir_preferencia(usar_cache_llm)
+    stats_llm = cache_llm.estatisticas()
+    st.caption(
+        f"Hit rate: {stats_llm['hit_rate']:.0%} · {stats_llm['hits']} hits / {stats_llm['misses']} misses · "
+        f"{stats_llm['itens']} itens ({stats_llm['tamanho_mb']} MB)"
+    )
+
 # --- CONFIG ---
 with st.container(border=True):
     col1, col2 = st.columns(2)
@@ -21,10 +37,52 @@ with st.container(border=True):
         generos = st.multiselect("Gêneros", ["Suspense", "Terror Psicológico", "Investigação"], default=["Suspense"])
     with col2:
         tema = st.text_area("Tema:", height=100, placeholder="Ex: Amigos presos numa cabana...")
+        modo_escrita = st.radio(
+            "Escrita dos capítulos", list(agentes_escrita.MODOS_ESCRITA), horizontal=True,
+            help="sequencial: cada capítulo lê o resumo do anterior. paralelo: todos ao mesmo tempo a partir do plano + passo de continuidade."
+        )
+        em_segundo_plano = st.toggle("Rodar em segundo plano (sobrevive a recarregar a página)")
+        contexto_compacto = st.toggle("Contexto compacto (custo fixo por capítulo)")
+        if contexto_compacto:
+            orcamento = st.number_input("Orçamento de contexto (tokens)", 200, 4000, contexto.ORCAMENTO_TOKENS, step=100)
+
+# --- RASCUNHOS EM SEGUNDO PLANO ---
+# Polling só enquanto há job ativo; quando todos terminam, um rerun completo desliga
+acompanhando_rascunhos = jobs.ha_ativos("rascunho")
+
+@st.fragment(run_every="3s" if acompanhando_rascunhos else None)
+def painel_rascunhos():
+    lista_jobs = jobs.listar("rascunho", limite=10)
+    if not lista_jobs: return
+    if acompanhando_rascunhos and not any(job['status'] in (jobs.PENDENTE, jobs.RODANDO) for job in lista_jobs):
+        st.rerun()
+    with st.expander(f"⏳ Rascunhos em segundo plano ({len(lista_jobs)})", expanded=True):
+        for job in lista_jobs:
+            c1, c2 = st.columns([4, 1])
+            with c1:
+                st.caption(f"**{job['titulo']}** · {job['status']} · {job['mensagem']}")
+                if job['status'] in (jobs.PENDENTE, jobs.RODANDO):
+                    st.progress(job['progresso'])
+            with c2:
+                if job['status'] == jobs.CONCLUIDO:
+                    if st.button("📥 Abrir", key=f"job_{job['id']}"):
+                        for chave, valor in job['resultado'].items():
+                            st.session_state[chave] = valor
+                        st.session_state.pop('critica_atual', None)
+                        st.rerun()
+
+painel_rascunhos()
 
 # --- 1. GERAÇÃO INICIAL ---
 if st.button("🚀 1. Criar Rascunho (Arquiteto)", type="primary"):
-    if tema and generos:
+    if tema and generos and em_segundo_plano:
+        jobs.enfileirar("rascunho", {
+            "tema": tema, "nicho": canal, "generos": ", ".join(generos), "modo": modo_escrita,
+            "orcamento_contexto": orcamento if contexto_compacto else None, "cache_llm": usar_cache_llm,
+        }, titulo=tema[:60])
+        st.toast("Rascunho na fila! Acompanhe no painel acima.", icon="⏳")
+        st.rerun()
+    elif tema and generos:
         generos_str = ", ".join(generos)
         st.session_state['tema_atual'] = tema
         st.session_state['generos_str'] = generos_str
@@ -41,28 +99,42 @@ if st.button("🚀 1. Criar Rascunho (Arquiteto)", type="primary"):
             except:
                 st.write(plano)
             
-            # Escrita
-            texto_full = ""
-            resumo = "Start."
-            prompts = []
+            # Escrita (resumo + visual numa chamada JSON por capítulo)
             progresso = st.progress(0)
-            
-            for i, cap in enumerate(plano):
-                tit = cap.get('title', f"Ch {i}")
-                evt = cap.get('events', '')
-                status.update(label=f"Escrevendo {tit}...")
-                
-                txt = agentes_escrita.agente_escreve_capitulo_v2(tit, evt, sinopse, resumo, generos_str)
-                prompts.extend(agentes_escrita.agente_visual(txt))
-                resumo += f"\n{agentes_escrita.agente_resumidor(txt)}"
-                texto_full += f"\n\n## {tit}\n\n{txt}"
-                progresso.progress((i+1)/len(plano))
+
+            def ao_progredir(i, total, tit):
+                if tit:
+                    status.update(label=f"Escrevendo {tit}...")
+                    st.markdown(f"#### {tit}")
+                progresso.progress(i/total if total else 1.0)
+
+            ctx = contexto.ContextoHistoria(sinopse, orcamento) if contexto_compacto else None
+
+            inicio = time.time()
+            with metricas.estagio("capitulos"):
+                if modo_escrita == "paralelo":
+                    # Todos de uma vez: os títulos aparecem conforme ficam prontos
+                    texto_full, prompts, resumo = agentes_escrita.escrever_capitulos_paralelo(
+                        plano, sinopse, generos_str, ao_progredir=ao_progredir, contexto=ctx
+                    )
+                else:
+                    # Cada capítulo aparece na tela enquanto é escrito
+                    texto_full, prompts, resumo = agentes_escrita.escrever_capitulos_pipeline(
+                        plano, sinopse, generos_str, ao_progredir=ao_progredir,
+                        consumir_stream=st.write_stream, contexto=ctx
+                    )
+            st.session_state['tempo_capitulos'] = (modo_escrita, time.time() - inicio)
+            if ctx:
+                st.session_state['tamanhos_contexto'] = ctx.relatorio()
             
             st.session_state['texto_completo_en'] = texto_full
             st.session_state['prompts_visuais'] = prompts
             
             st.write("Traduzindo...")
-            st.session_state['texto_completo_pt'] = agentes_escrita.agente_tradutor(texto_full)
+            with metricas.estagio("traducao"):
+                texto_pt, falhas = agentes_escrita.agente_tradutor(texto_full)
+                st.session_state['texto_completo_pt'] = texto_pt
+                st.session_state['capitulos_sem_traducao'] = falhas
             status.update(label="Rascunho Pronto!", state="complete")
             st.rerun()
 
@@ -70,32 +142,82 @@ if st.button("🚀 1. Criar Rascunho (Arquiteto)", type="primary"):
 if st.session_state.get('texto_completo_pt'):
     st.divider()
     st.subheader("🔁 Ciclo de Refinamento")
+
+    falhas = st.session_state.get('capitulos_sem_traducao')
+    if falhas:
+        st.error(f"⚠️ Capítulo(s) {', '.join(str(i + 1) for i in falhas)} ficaram em inglês (a tradução falhou).")
+        if st.button("🔁 Traduzir de novo esses capítulos"):
+            with st.spinner("Traduzindo..."):
+                texto_pt, restantes = agentes_escrita.retraduzir_capitulos(
+                    st.session_state['texto_completo_pt'], st.session_state['texto_completo_en'], falhas
+                )
+            st.session_state['texto_completo_pt'] = texto_pt
+            st.session_state['capitulos_sem_traducao'] = restantes
+            st.rerun()
     
+    modo_refino = st.radio(
+        "Modo", ["Por capítulo", "História completa"], horizontal=True,
+        help="Por capítulo: o crítico aponta capítulos e só eles são reescritos, em paralelo."
+    )
+    por_capitulo = modo_refino == "Por capítulo"
     col_crit, col_rewrite = st.columns(2)
     
     with col_crit:
         if st.button("🕵️ 2. Chamar o Crítico"):
             with st.spinner("Analisando..."):
-                critica = agentes_escrita.agente_critico(
-                    st.session_state['texto_completo_pt'], 
-                    st.session_state.get('generos_str', 'Terror')
-                )
-                st.session_state['critica_atual'] = critica
+                if por_capitulo:
+                    critica = agentes_escrita.agente_critico_por_capitulo(
+                        st.session_state['texto_completo_pt'],
+                        st.session_state.get('generos_str', 'Terror')
+                    )
+                    st.session_state['critica_estruturada'] = critica
+                    st.session_state['critica_atual'] = agentes_escrita.formatar_critica(critica)
+                else:
+                    critica = st.write_stream(agentes_escrita.agente_critico(
+                        st.session_state['texto_completo_pt'], 
+                        st.session_state.get('generos_str', 'Terror'),
+                        stream=True
+                    ))
+                    st.session_state.pop('critica_estruturada', None)
+                    st.session_state['critica_atual'] = critica
                 st.rerun()
 
     with col_rewrite:
         tem_critica = 'critica_atual' in st.session_state
-        if st.button("✍️ 3. Aplicar Correções (Reescrever)", disabled=not tem_critica, type="primary"):
-            with st.spinner("Reescrevendo a história..."):
-                novo_texto = agentes_escrita.agente_reescritor(
-                    st.session_state['texto_completo_pt'],
-                    st.session_state['critica_atual'],
-                    st.session_state.get('generos_str', 'Terror')
-                )
-                st.session_state['texto_completo_pt'] = novo_texto
-                del st.session_state['critica_atual'] # Limpa para nova crítica
-                st.toast("História Reescrita!", icon="✨")
-                st.rerun()
+        estruturada = st.session_state.get('critica_estruturada')
+        # Crítica por capítulo sem alvos (JSON inválido ou nada a mudar): não há o que reescrever
+        sem_alvos = estruturada is not None and not estruturada['capitulos']
+        if sem_alvos:
+            st.warning("O crítico não apontou capítulos para reescrever. Chame o crítico de novo ou use 'História completa'.")
+        if st.button("✍️ 3. Aplicar Correções (Reescrever)", disabled=not tem_critica or sem_alvos, type="primary"):
+            if estruturada is not None:
+                alvos = len(estruturada['capitulos'])
+                with st.spinner(f"Reescrevendo {alvos} capítulo(s) em paralelo..."):
+                    novo_texto = agentes_escrita.reescrever_capitulos(
+                        st.session_state['texto_completo_pt'], estruturada,
+                        st.session_state.get('generos_str', 'Terror')
+                    )
+            else:
+                with st.spinner("Reescrevendo a história..."):
+                    novo_texto = st.write_stream(agentes_escrita.agente_reescritor(
+                        st.session_state['texto_completo_pt'],
+                        st.session_state['critica_atual'],
+                        st.session_state.get('generos_str', 'Terror'),
+                        stream=True
+                    ))
+            st.session_state['texto_completo_pt'] = novo_texto
+            del st.session_state['critica_atual'] # Limpa para nova crítica
+            st.session_state.pop('critica_estruturada', None)
+            st.toast("História Reescrita!", icon="✨")
+            st.rerun()
+
+    if st.session_state.get('tempo_capitulos'):
+        modo_usado, segundos = st.session_state['tempo_capitulos']
+        st.caption(f"⏱️ Capítulos escritos em {segundos:.1f}s (modo {modo_usado})")
+
+    if st.session_state.get('tamanhos_contexto'):
+        with st.expander("📏 Tamanho do prompt por capítulo (tokens estimados)"):
+            st.bar_chart(pd.DataFrame(st.session_state['tamanhos_contexto']).set_index('capitulo'))
 
     if st.session_state.get('critica_atual'):
         st.warning("⚠️ Notas do Crítico:")
@@ -117,6 +239,7 @@ if st.session_state.get('texto_completo_pt'):
                 f"{canal}", st.session_state.get('tema_atual'), st.session_state.get('generos_str'),
                 st.session_state['texto_completo_pt'],
                 st.session_state.get('texto_completo_en', ''),
-                st.session_state.get('prompts_visuais', [])
+                st.session_state.get('prompts_visuais', []),
+                sinopse=st.session_state.get('sinopse_en', '')
             )
             st.success("Salvo! Vá para o Estúdio.")
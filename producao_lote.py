@@ -0,0 +1,206 @@
+"""
+Produção em lote, sem interface (roda a noite toda).
+
+Uso:
+    python producao_lote.py historias.csv --escrita 4 --tts 4 --imagens 8 --render 2
+
+Entrada: CSV (colunas nicho, tema, generos) ou JSONL com as mesmas chaves.
+Cada história passa por escritor → tradutor → salvar → TTS → imagens → render.
+O progresso fica em --estado; rodar de novo retoma de onde parou.
+Credenciais: .streamlit/secrets.toml, como no app.
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import utils
+import agentes_escrita
+import agentes_producao
+import metricas
+
+def ler_entrada(caminho):
+    with open(caminho, "r", encoding="utf-8") as f:
+        if caminho.endswith(".jsonl"):
+            itens = [json.loads(l) for l in f if l.strip()]
+        else:
+            itens = list(csv.DictReader(f))
+    for item in itens:
+        if not item.get("tema"): raise ValueError(f"Linha sem tema: {item}")
+        item.setdefault("nicho", "Mistério/Terror")
+        item.setdefault("generos", "Suspense")
+    return itens
+
+def chave_item(item):
+    base = json.dumps([item["nicho"], item["tema"], item["generos"]], ensure_ascii=False)
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:12]
+
+def slug(texto):
+    return re.sub(r"[^a-z0-9]+", "_", texto.lower())[:40].strip("_") or "historia"
+
+class Estado:
+    """Estado por história em JSON (gravado a cada etapa, para retomar)."""
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self.dados = {}
+        if os.path.exists(caminho):
+            with open(caminho, "r", encoding="utf-8") as f:
+                self.dados = json.load(f)
+
+    def obter(self, chave):
+        with self._lock:
+            return dict(self.dados.get(chave, {}))
+
+    def gravar(self, chave, **campos):
+        with self._lock:
+            self.dados.setdefault(chave, {}).update(campos)
+            tmp = self.caminho + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.dados, f, ensure_ascii=False, indent=1, default=str)
+            os.replace(tmp, self.caminho)
+
+def produzir(item, estado, limites, args):
+    chave = chave_item(item)
+    feito = estado.obter(chave)
+    nome = f"{slug(item['tema'])}_{chave}"
+    tempos = dict(feito.get("tempos", {}))
+
+    def etapa(nome_etapa, func):
+        if nome_etapa in feito: return feito[nome_etapa]
+        with limites[nome_etapa], metricas.estagio(nome_etapa):
+            inicio = time.time()
+            resultado = func()
+        tempos[nome_etapa] = round(time.time() - inicio, 1)
+        estado.gravar(chave, **{nome_etapa: resultado, "tempos": tempos})
+        feito[nome_etapa] = resultado
+        print(f"[{nome}] ✔ {nome_etapa} ({tempos[nome_etapa]}s)")
+        return resultado
+
+    try:
+        estado.gravar(chave, tema=item["tema"], status="rodando")
+        rascunho = etapa("rascunho", lambda: agentes_escrita.gerar_rascunho(
+            item["tema"], item["nicho"], item["generos"], modo=args.modo_escrita,
+            orcamento_contexto=args.contexto_compacto or None
+        ))
+
+        def salvar():
+            # Não narra/salva roteiro PT com capítulos em inglês: tenta de novo só esses
+            if rascunho.get("capitulos_sem_traducao"):
+                texto_pt, falhas = agentes_escrita.retraduzir_capitulos(
+                    rascunho["texto_completo_pt"], rascunho["texto_completo_en"], rascunho["capitulos_sem_traducao"]
+                )
+                rascunho.update(texto_completo_pt=texto_pt, capitulos_sem_traducao=falhas)
+                estado.gravar(chave, rascunho=rascunho)
+                if falhas: raise RuntimeError(f"Tradução falhou nos capítulos {[i + 1 for i in falhas]}")
+            ok = utils.salvar_historia_db(
+                item["nicho"], item["tema"], item["generos"],
+                rascunho["texto_completo_pt"], rascunho["texto_completo_en"],
+                rascunho["prompts_visuais"], sinopse=rascunho["sinopse_en"]
+            )
+            if not ok: raise RuntimeError("Falha ao salvar no Firestore")
+            return True
+        etapa("salvo", salvar)
+
+        def audio():
+            caminhos = {"duracoes": {}}
+            for idioma, texto in (("pt", rascunho["texto_completo_pt"]), ("en", rascunho["texto_completo_en"])):
+                caminho, duracoes = agentes_producao.gerar_audio_com_duracoes(
+                    texto, idioma, item["tema"], arquivo=f"temp/audio_{nome}_{idioma}.mp3"
+                )
+                if not caminho: raise RuntimeError(f"TTS falhou ({idioma})")
+                caminhos[idioma] = caminho
+                # Narração por capítulo: cada imagem dura o trecho do seu capítulo
+                caminhos["duracoes"][idioma] = agentes_producao.duracoes_por_capitulo(texto, duracoes)
+            return caminhos
+        audios = etapa("audio", audio)
+
+        def imagens():
+            # Mantém None nas falhas: a posição diz a que capítulo a imagem pertence
+            return agentes_producao.gerar_imagens_em_lote(rascunho["prompts_visuais"], max_workers=args.imagens)
+        lista_imgs = etapa("imagens", imagens)
+
+        def video():
+            os.makedirs(args.saida, exist_ok=True)
+            videos = {}
+            for idioma in ("pt", "en"):
+                imgs, duracoes_cenas = agentes_producao.duracoes_por_cena(
+                    lista_imgs, audios.get("duracoes", {}).get(idioma)
+                )
+                v = agentes_producao.renderizar_video_com_imagens(
+                    audios[idioma], imgs, idioma, backend=args.backend,
+                    output=os.path.join(args.saida, f"{nome}_{idioma}.mp4"),
+                    duracoes_cenas=duracoes_cenas
+                )
+                if not v: raise RuntimeError(f"Render falhou ({idioma})")
+                videos[idioma] = v
+            return videos
+        etapa("video", video)
+
+        estado.gravar(chave, status="concluido", erro=None)
+    except Exception as e:
+        print(f"[{nome}] ❌ {e}")
+        estado.gravar(chave, status="erro", erro=str(e))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Produção de histórias em lote (sem interface).")
+    parser.add_argument("entrada", help="CSV ou JSONL com nicho, tema, generos")
+    parser.add_argument("--escrita", type=int, default=2, help="rascunhos simultâneos")
+    parser.add_argument("--tts", type=int, default=2, help="narrações simultâneas")
+    parser.add_argument("--imagens", type=int, default=4, help="chamadas de imagem simultâneas")
+    parser.add_argument("--render", type=int, default=1, help="renderizações simultâneas")
+    parser.add_argument("--backend", default="ffmpeg", choices=agentes_producao.BACKENDS_RENDER)
+    parser.add_argument("--modo-escrita", default="sequencial", choices=list(agentes_escrita.MODOS_ESCRITA))
+    parser.add_argument("--contexto-compacto", type=int, default=0, metavar="TOKENS",
+                        help="orçamento do contexto rolante do escritor (0 = sinopse + todos os resumos)")
+    parser.add_argument("--saida", default="videos", help="pasta dos vídeos")
+    parser.add_argument("--estado", default="temp/lote_estado.json", help="arquivo de retomada")
+    parser.add_argument("--relatorio", default=None, help="grava o resumo em JSON")
+    args = parser.parse_args(argv)
+
+    if not utils.setup_api():
+        print("Erro ao conectar nas APIs. Verifique o secrets.toml")
+        return 1
+
+    itens = ler_entrada(args.entrada)
+    os.makedirs(os.path.dirname(args.estado) or ".", exist_ok=True)
+    estado = Estado(args.estado)
+    limites = {
+        "rascunho": threading.Semaphore(args.escrita),
+        "salvo": threading.Semaphore(args.escrita),
+        "audio": threading.Semaphore(args.tts),
+        "imagens": threading.Semaphore(1),  # um lote por vez, com --imagens chamadas
+        "video": threading.Semaphore(args.render),
+    }
+
+    inicio = time.time()
+    # Uma thread por história; os semáforos limitam cada etapa
+    total_workers = max(args.escrita, args.tts, args.render, 1) * 2
+    with ThreadPoolExecutor(max_workers=total_workers) as executor:
+        list(executor.map(lambda item: produzir(item, estado, limites, args), itens))
+
+    chaves = [chave_item(i) for i in itens]
+    resultados = [estado.obter(c) for c in chaves]
+    resumo = {
+        "total": len(itens),
+        "concluidas": sum(1 for r in resultados if r.get("status") == "concluido"),
+        "erros": [{"tema": r.get("tema"), "erro": r.get("erro")} for r in resultados if r.get("status") == "erro"],
+        "duracao_s": round(time.time() - inicio, 1),
+        "videos": {r.get("tema"): r.get("video") for r in resultados if r.get("video")},
+    }
+    print(f"\n✅ {resumo['concluidas']}/{resumo['total']} concluídas em {resumo['duracao_s']}s")
+    for e in resumo["erros"]:
+        print(f"   ❌ {e['tema']}: {e['erro']}")
+    if args.relatorio:
+        with open(args.relatorio, "w", encoding="utf-8") as f:
+            json.dump(resumo, f, ensure_ascii=False, indent=2)
+    return 0 if not resumo["erros"] else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import os
+import re
+import json
+import time
+import threading
+import hashlib
+import shutil
+import tempfile
+import subprocess
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import imageio_ffmpeg
+
+# --- BACKEND FFMPEG (KEN BURNS NATIVO) ---
+# Mesmo resultado do MoviePy (zoom 1 + 0.04*t centralizado, 16:9, concat),
+# mas todo o trabalho por frame acontece dentro do ffmpeg, não em Python.
+
+LARGURA = 1920
+ALTURA = 1080
+FPS = 24
+ZOOM_POR_SEGUNDO = 0.04
+# Zoompan em resolução maior evita o "tremido" do arredondamento de pixels
+SUPERAMOSTRAGEM = 2
+
+def ffmpeg_exe():
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def _executar(args):
+    cmd = [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg falhou: {proc.stderr.strip()[-500:]}")
+    return proc
+
+def duracao_midia(caminho):
+    """Lê a duração (s) do cabeçalho via `ffmpeg -i`, sem decodificar o arquivo."""
+    proc = subprocess.run([ffmpeg_exe(), "-hide_banner", "-i", caminho], capture_output=True, text=True)
+    m = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", proc.stderr)
+    if not m: raise RuntimeError(f"Não foi possível ler a duração de {caminho}")
+    h, mi, seg = m.groups()
+    return int(h) * 3600 + int(mi) * 60 + float(seg)
+
+def frames_por_cena(duracao_total, n_cenas, fps=FPS, duracoes=None):
+    """
+    Divide os frames entre as cenas com arredondamento acumulado (sem drift de A/V).
+    Com `duracoes` (s por cena, ex: narração de cada capítulo), a divisão segue as
+    proporções delas, ajustadas para somar duracao_total; sem elas, é por igual.
+    """
+    pesos = list(duracoes) if duracoes and len(duracoes) == n_cenas and sum(duracoes) > 0 else [1.0] * n_cenas
+    soma = sum(pesos)
+    frames = []
+    anterior = 0
+    acumulado = 0.0
+    for peso in pesos:
+        acumulado += peso
+        atual = round(duracao_total * acumulado / soma * fps)
+        frames.append(max(1, atual - anterior))
+        anterior = atual
+    return frames
+
+def filtro_ken_burns(n_frames, fps=FPS, largura=LARGURA, altura=ALTURA, zoom=ZOOM_POR_SEGUNDO):
+    """Filtro de uma cena: preenche 16:9, aplica zoom central e gera n_frames."""
+    lw, la = largura * SUPERAMOSTRAGEM, altura * SUPERAMOSTRAGEM
+    return (
+        f"scale={lw}:{la}:force_original_aspect_ratio=increase,crop={lw}:{la},"
+        f"zoompan=z='1+{zoom}*on/{fps}':d={n_frames}"
+        f":x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':s={largura}x{altura}:fps={fps},"
+        f"setsar=1,format=yuv420p"
+    )
+
+def renderizar_ken_burns(audio_path, lista_imagens, output, fps=FPS, preset="ultrafast", duracoes=None):
+    """Renderiza o vídeo inteiro num único grafo de filtros (zoompan + concat)."""
+    duracao = duracao_midia(audio_path)
+    frames = frames_por_cena(duracao, len(lista_imagens), fps, duracoes)
+
+    args = []
+    for img in lista_imagens:
+        args += ["-i", img]
+    args += ["-i", audio_path]
+
+    filtros = [f"[{i}:v]{filtro_ken_burns(n, fps)}[v{i}]" for i, n in enumerate(frames)]
+    entradas = "".join(f"[v{i}]" for i in range(len(lista_imagens)))
+    filtros.append(f"{entradas}concat=n={len(lista_imagens)}:v=1:a=0[v]")
+
+    args += [
+        "-filter_complex", ";".join(filtros),
+        "-map", "[v]", "-map", f"{len(lista_imagens)}:a",
+        "-c:v", "libx264", "-preset", preset, "-r", str(fps),
+        "-c:a", "aac", "-shortest", output,
+    ]
+    _executar(args)
+    return output
+
+def cortar_audio(entrada, saida, duracao):
+    """Corta os primeiros `duracao` segundos com stream copy (corte em limite de frame, sem re-encode)."""
+    _executar(["-i", entrada, "-t", f"{duracao:.3f}", "-map", "0:a", "-c", "copy", saida])
+    return saida
+
+# --- MODO SEGMENTADO (UMA CENA POR PROCESSO) ---
+def renderizar_segmento(img, n_frames, saida, fps=FPS, preset="ultrafast", threads=1):
+    """Codifica uma cena isolada (mesmos fps/codec/preset do render completo)."""
+    _executar([
+        "-i", img,
+        "-vf", filtro_ken_burns(n_frames, fps),
+        "-frames:v", str(n_frames),
+        "-c:v", "libx264", "-preset", preset, "-r", str(fps),
+        "-threads", str(threads), "-an", saida,
+    ])
+    return saida
+
+def concatenar_segmentos(segmentos, audio_path, output, pasta):
+    """Junta os segmentos com o concat demuxer (stream copy) e adiciona o áudio."""
+    lista = os.path.join(pasta, "lista.txt")
+    with open(lista, "w", encoding="utf-8") as f:
+        for seg in segmentos:
+            caminho = os.path.abspath(seg).replace("'", "'\\''")
+            f.write(f"file '{caminho}'\n")
+    _executar([
+        "-f", "concat", "-safe", "0", "-i", lista,
+        "-i", audio_path,
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "copy", "-c:a", "aac", "-shortest", output,
+    ])
+    return output
+
+# --- CACHE DE SEGMENTOS ---
+# Uma cena renderizada só depende da imagem e dos parâmetros do efeito; a duração
+# não entra na chave. Cada cena é codificada uma vez com folga (segmento "mestre")
+# e cortada no tamanho pedido com -frames:v + stream copy: o x264 ultrafast não
+# usa B-frames, então cortar o final é seguro. Assim trocar só o áudio ou o idioma
+# reaproveita as cenas. LRU por tamanho, como o cache de imagens.
+# Renders simultâneos da mesma imagem (PT e EN, prévia + final) gravam mestres com
+# nomes distintos por tamanho; o índice só troca para um mestre mais longo, e o
+# arquivo substituído só é apagado quando nenhum outro render ainda o usa.
+PASTA_SEGMENTOS = "temp/segmentos_cache"
+LIMITE_SEGMENTOS_MB = int(os.environ.get("LIMITE_CACHE_SEGMENTOS_MB", "2048"))
+FOLGA_SEGMENTO = 1.5       # mestre = frames pedidos x folga...
+MINIMO_SEGMENTO_S = 20     # ...e nunca menos que isso
+ultimo_render = {"reaproveitados": 0, "renderizados": 0}
+
+_lock_segmentos = threading.Lock()
+_em_uso = Counter()  # chave -> renders em andamento usando o mestre
+
+def _digest_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def chave_segmento(img, fps, preset):
+    params = {
+        "img": _digest_arquivo(img), "fps": fps, "preset": preset,
+        "res": [LARGURA, ALTURA], "zoom": ZOOM_POR_SEGUNDO, "ss": SUPERAMOSTRAGEM,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+def _arquivo_indice_segmentos():
+    return os.path.join(PASTA_SEGMENTOS, "index.json")
+
+def _carregar_indice_segmentos():
+    try:
+        with open(_arquivo_indice_segmentos(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _salvar_indice_segmentos(indice):
+    tmp = _arquivo_indice_segmentos() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(indice, f)
+    os.replace(tmp, _arquivo_indice_segmentos())
+
+def _apagar_arquivos(caminhos):
+    for caminho in caminhos:
+        try: os.remove(caminho)
+        except OSError: pass
+
+def _evictar_segmentos(indice, limite_bytes, em_uso):
+    # Remove os mestres menos usados até caber (os do render atual ficam)
+    total = sum(e["tamanho"] for e in indice.values())
+    for chave, entrada in sorted(indice.items(), key=lambda kv: kv[1]["ultimo_acesso"]):
+        if total <= limite_bytes: break
+        if chave in em_uso: continue
+        _apagar_arquivos([entrada["arquivo"], *entrada.get("antigos", [])])
+        total -= entrada["tamanho"]
+        del indice[chave]
+
+def _registrar_mestre(indice, chave, destino, n_mestre, outros_usando):
+    """Atualiza o índice com um mestre recém-renderizado, sem trocar um mais longo por um mais curto."""
+    entrada = indice.get(chave)
+    if entrada and entrada["frames"] >= n_mestre and os.path.exists(entrada["arquivo"]):
+        # Outro render deixou um mestre tão longo quanto: fica o dele
+        if entrada["arquivo"] != destino: _apagar_arquivos([destino])
+        return
+    antigos = list(entrada.get("antigos", [])) if entrada else []
+    if entrada and entrada["arquivo"] != destino: antigos.append(entrada["arquivo"])
+    if not outros_usando:
+        _apagar_arquivos(antigos)
+        antigos = []
+    indice[chave] = {"arquivo": destino, "frames": n_mestre, "tamanho": os.path.getsize(destino), "antigos": antigos}
+
+def _renderizar_segmento_cache(img, n_frames, destino, fps, preset):
+    # Renderiza em arquivo temporário e move (evita segmento pela metade no cache)
+    tmp = f"{destino[:-4]}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+    renderizar_segmento(img, n_frames, tmp, fps, preset)
+    os.replace(tmp, destino)
+    return destino
+
+def cortar_segmento(mestre, n_frames, saida):
+    """Primeiros n_frames do mestre, sem re-encode."""
+    _executar(["-i", mestre, "-map", "0:v", "-frames:v", str(n_frames), "-c", "copy", saida])
+    return saida
+
+def renderizar_segmentado(audio_path, lista_imagens, output, fps=FPS, preset="ultrafast", workers=None, duracoes=None):
+    """
+    Renderiza cada cena num processo separado e concatena sem re-encode.
+    Cenas com mestre em cache (longo o bastante) não são recodificadas.
+    """
+    duracao = duracao_midia(audio_path)
+    frames = frames_por_cena(duracao, len(lista_imagens), fps, duracoes)
+    os.makedirs(PASTA_SEGMENTOS, exist_ok=True)
+    chaves = [chave_segmento(img, fps, preset) for img in lista_imagens]
+
+    # Maior duração pedida por mestre (a mesma imagem pode aparecer em várias cenas)
+    necessarios = {}
+    for img, chave, n in zip(lista_imagens, chaves, frames):
+        necessarios[chave] = (img, max(n, necessarios.get(chave, (None, 0))[1]))
+
+    with _lock_segmentos:
+        indice = _carregar_indice_segmentos()
+        pendentes = []
+        for chave, (img, n) in necessarios.items():
+            entrada = indice.get(chave)
+            if entrada and entrada["frames"] >= n and os.path.exists(entrada["arquivo"]): continue
+            n_mestre = max(int(n * FOLGA_SEGMENTO), MINIMO_SEGMENTO_S * fps)
+            pendentes.append((img, n_mestre, os.path.join(PASTA_SEGMENTOS, f"{chave}.{n_mestre}.mp4")))
+        _em_uso.update(list(necessarios))  # protege da eviction de outros renders simultâneos
+
+    try:
+        recodificar = {os.path.basename(p[2]).split(".")[0] for p in pendentes}
+        ultimo_render["renderizados"] = sum(1 for c in chaves if c in recodificar)
+        ultimo_render["reaproveitados"] = len(chaves) - ultimo_render["renderizados"]
+
+        if pendentes:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                list(executor.map(
+                    _renderizar_segmento_cache, *zip(*pendentes),
+                    [fps] * len(pendentes), [preset] * len(pendentes)
+                ))
+
+        with _lock_segmentos:
+            indice = _carregar_indice_segmentos()
+            for _, n_mestre, destino in pendentes:
+                chave = os.path.basename(destino).split(".")[0]
+                _registrar_mestre(indice, chave, destino, n_mestre, _em_uso[chave] > 1)
+            agora = time.time()
+            mestres = {}
+            for chave, (_, n) in necessarios.items():
+                entrada = indice.get(chave)
+                # Confere de novo: o mestre que vai ser cortado tem de cobrir a cena inteira
+                if not entrada or entrada["frames"] < n or not os.path.exists(entrada["arquivo"]):
+                    raise RuntimeError(f"Segmento em cache mais curto que a cena ({chave[:12]}: precisa de {n} frames)")
+                entrada["ultimo_acesso"] = agora
+                mestres[chave] = entrada["arquivo"]
+                if entrada.get("antigos") and _em_uso[chave] <= 1:
+                    _apagar_arquivos(entrada["antigos"])  # mestres substituídos que ninguém mais usa
+                    entrada["antigos"] = []
+            _evictar_segmentos(indice, LIMITE_SEGMENTOS_MB * 1024 * 1024, set(_em_uso))
+            _salvar_indice_segmentos(indice)
+
+        pasta = tempfile.mkdtemp(prefix="concat_", dir="temp")
+        try:
+            segmentos = [
+                cortar_segmento(mestres[chave], n, os.path.join(pasta, f"cena_{i:03d}.mp4"))
+                for i, (chave, n) in enumerate(zip(chaves, frames))
+            ]
+            return concatenar_segmentos(segmentos, audio_path, output, pasta)
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+    finally:
+        with _lock_segmentos:
+            _em_uso.subtract(list(necessarios))
+            for chave in [c for c, n in _em_uso.items() if n <= 0]: del _em_uso[chave]
@@ -2,8 +2,14 @@ import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore
 import nest_asyncio
+import os
+import re
+import math
+import time
+import threading
 from datetime import datetime
 from google import genai 
+import busca
 
 nest_asyncio.apply()
 
@@ -16,7 +22,8 @@ def setup_api():
     try:
         if "GOOGLE_API_KEY" not in st.secrets:
             return False
-        client = genai.Client(api_key=st.secrets["GOOGLE_API_KEY"])
+        if get_google_client() is None:
+            return False
     except Exception as e:
         st.error(f"Erro na API Google: {e}")
         return False
@@ -42,11 +49,62 @@ def setup_api():
         return False
 
 # --- HELPER: ENTREGAR O CLIENTE ---
+# Registro de clientes por processo: um genai.Client por API key, reaproveitado
+# por todas as chamadas e sessões (mantém o pool HTTP/TLS aberto).
+_clientes_lock = threading.Lock()
+_clientes = {}
+_stats_clientes = {"criados": 0, "reutilizados": 0, "ms_criacao": 0.0}
+# Aquecimento opcional (AQUECER_CLIENTES=1 no ambiente), uma vez por processo
+AQUECER_CLIENTES = os.environ.get("AQUECER_CLIENTES", "0") == "1"
+_aquecimento = {"feito": False, "ms": None}
+
 def get_google_client():
     try:
-        return genai.Client(api_key=st.secrets["GOOGLE_API_KEY"])
+        api_key = st.secrets["GOOGLE_API_KEY"]
     except:
         return None
+    with _clientes_lock:
+        client = _clientes.get(api_key)
+        if client is not None:
+            _stats_clientes["reutilizados"] += 1
+            return client
+        try:
+            inicio = time.perf_counter()
+            client = genai.Client(api_key=api_key)
+            _stats_clientes["ms_criacao"] += (time.perf_counter() - inicio) * 1000
+        except:
+            return None
+        _stats_clientes["criados"] += 1
+        _clientes[api_key] = client
+        return client
+
+def get_google_client_async():
+    """Mesmo cliente, interface assíncrona (client.aio) — compartilha a configuração."""
+    client = get_google_client()
+    return client.aio if client else None
+
+def aquecer_clientes(modelo):
+    """
+    Abre a conexão com a API antecipadamente, uma vez por processo.
+    `modelo` = o modelo de texto em uso (agentes_escrita.MODELO_TEXTO). Retorna ms.
+    """
+    with _clientes_lock:
+        if _aquecimento["feito"]: return _aquecimento["ms"]
+        _aquecimento["feito"] = True
+    client = get_google_client()
+    if not client: return None
+    inicio = time.perf_counter()
+    try:
+        client.models.get(model=modelo)
+    except Exception as e:
+        print(f"Aquecimento do cliente falhou: {e}")
+        return None
+    _aquecimento["ms"] = (time.perf_counter() - inicio) * 1000
+    return _aquecimento["ms"]
+
+def estatisticas_clientes():
+    with _clientes_lock:
+        return {**_stats_clientes, "clientes_ativos": len(_clientes)}
 
 # --- SEGURANÇA (CORRIGIDA) ---
 def verificar_senha():
@@ -80,25 +138,180 @@ def verificar_senha():
     return False
 
 # --- FIREBASE ---
-def salvar_historia_db(nicho, tema, generos, texto_pt, texto_en, prompts_visuais):
+# Layout "capitulos": documento pai leve (metadados) + subcoleção `capitulos`
+# com o texto PT/EN e os prompts de cada capítulo. Evita o limite de 1 MiB
+# por documento e permite ler só o que a tela precisa.
+LAYOUT_CAPITULOS = "capitulos"
+LIMITE_BATCH = 500  # máximo de operações por commit no Firestore
+
+def dividir_capitulos(texto):
+    """Divide nos cabeçalhos '## ' preservando o texto ("".join(partes) == texto)."""
+    if not texto: return []
+    partes = [p for p in re.split(r'(?m)^(?=## )', texto) if p]
+    # Espaço em branco antes do 1º título vai junto com ele (mantém PT/EN alinhados)
+    if len(partes) > 1 and not partes[0].strip():
+        partes[1] = partes[0] + partes[1]
+        partes = partes[1:]
+    return partes
+
+def _distribuir_prompts(prompts, n):
+    # Os prompts são gerados em sequência por capítulo; reparte em blocos iguais
+    if n <= 0: return []
+    tamanho = math.ceil(len(prompts) / n) if prompts else 0
+    return [prompts[i * tamanho:(i + 1) * tamanho] for i in range(n)]
+
+def _commit_em_lotes(db, operacoes):
+    """Aplica [(ref, dados, tipo)] em batches de até LIMITE_BATCH operações."""
+    for inicio in range(0, len(operacoes), LIMITE_BATCH):
+        batch = db.batch()
+        for ref, dados, tipo in operacoes[inicio:inicio + LIMITE_BATCH]:
+            if tipo == "update": batch.update(ref, dados)
+            else: batch.set(ref, dados)
+        batch.commit()
+
+def _operacoes_capitulos(doc_ref, texto_pt, texto_en, prompts_visuais):
+    caps_pt = dividir_capitulos(texto_pt)
+    caps_en = dividir_capitulos(texto_en)
+    n = max(len(caps_pt), len(caps_en), 1)
+    prompts_por_cap = _distribuir_prompts(prompts_visuais or [], n)
+    operacoes = []
+    for i in range(n):
+        operacoes.append((doc_ref.collection("capitulos").document(f"{i:03d}"), {
+            "indice": i,
+            "texto_pt": caps_pt[i] if i < len(caps_pt) else "",
+            "texto_en": caps_en[i] if i < len(caps_en) else "",
+            "prompts": prompts_por_cap[i] if i < len(prompts_por_cap) else [],
+            "atualizado_em": firestore.SERVER_TIMESTAMP,  # deltas do índice de busca
+        }, "set"))
+    return operacoes, n
+
+def salvar_historia_db(nicho, tema, generos, texto_pt, texto_en, prompts_visuais, sinopse=""):
     try:
         db = firestore.client()
+        doc_ref = db.collection("historias").document()
+        operacoes, n = _operacoes_capitulos(doc_ref, texto_pt, texto_en, prompts_visuais)
         dados = {
             "nicho": nicho, "generos": generos, "tema": tema,
-            "roteiro_pt": texto_pt, "roteiro_en": texto_en,
-            "prompts": prompts_visuais,
+            "sinopse": sinopse or "",
+            "layout": LAYOUT_CAPITULOS, "n_capitulos": n,
             "data_criacao": datetime.now(),
+            "atualizado_em": firestore.SERVER_TIMESTAMP,
             "status": "Roteiro Pronto"
         }
-        db.collection("historias").add(dados)
+        # Pai por último: quem lê o pai já encontra os capítulos gravados
+        _commit_em_lotes(db, operacoes + [(doc_ref, dados, "set")])
+        # Indexa já com o texto dividido (outros processos pegam pelos deltas)
+        indice = busca.obter_indice()
+        indice.atualizar(doc_ref.id, dados)
+        indice.indexar_capitulos(doc_ref.id, texto_pt, texto_en, dividir_capitulos)
         return True
     except Exception as e:
         st.error(f"Erro ao salvar: {e}")
         return False
 
+def carregar_capitulos(historia_id, indices=None):
+    """Busca os capítulos (todos ou só `indices`) em ordem."""
+    db = firestore.client()
+    caps_ref = db.collection("historias").document(historia_id).collection("capitulos")
+    if indices is not None:
+        refs = [caps_ref.document(f"{i:03d}") for i in indices]
+        docs = [d for d in db.get_all(refs) if d.exists]
+    else:
+        docs = caps_ref.order_by("indice").stream()
+    return sorted((d.to_dict() for d in docs), key=lambda c: c["indice"])
+
+def _montar_historia(dado, capitulos):
+    dado["roteiro_pt"] = "".join(c.get("texto_pt", "") for c in capitulos)
+    dado["roteiro_en"] = "".join(c.get("texto_en", "") for c in capitulos)
+    dado["prompts"] = [p for c in capitulos for p in c.get("prompts", [])]
+    return dado
+
+def migrar_para_capitulos(historia_id=None):
+    """
+    Migração única: move roteiros/prompts dos documentos antigos para a subcoleção.
+    Sem `historia_id`, migra todos que ainda não estão no novo layout.
+    Retorna quantos documentos foram migrados.
+    """
+    db = firestore.client()
+    col = db.collection("historias")
+    docs = [col.document(historia_id).get()] if historia_id else col.stream()
+    migrados = 0
+    for doc in docs:
+        if not doc.exists: continue
+        dado = doc.to_dict()
+        if dado.get("layout") == LAYOUT_CAPITULOS: continue
+        operacoes, n = _operacoes_capitulos(
+            doc.reference, dado.get("roteiro_pt", ""), dado.get("roteiro_en", ""), dado.get("prompts", [])
+        )
+        operacoes.append((doc.reference, {
+            "layout": LAYOUT_CAPITULOS, "n_capitulos": n,
+            "roteiro_pt": firestore.DELETE_FIELD,
+            "roteiro_en": firestore.DELETE_FIELD,
+            "prompts": firestore.DELETE_FIELD,
+        }, "update"))
+        _commit_em_lotes(db, operacoes)
+        indice = busca.obter_indice()
+        indice.atualizar(doc.id, {k: v for k, v in dado.items() if k not in ("roteiro_pt", "roteiro_en")})
+        indice.indexar_capitulos(doc.id, dado.get("roteiro_pt", ""), dado.get("roteiro_en", ""), dividir_capitulos)
+        migrados += 1
+    if migrados: busca.obter_indice().salvar()
+    return migrados
+
 def atualizar_status_historia(historia_id, novo_status):
+    return atualizar_status_em_lote([historia_id], novo_status)
+
+def atualizar_status_em_lote(historia_ids, novo_status):
     try:
         db = firestore.client()
-        db.collection("historias").document(historia_id).update({"status": novo_status})
+        col = db.collection("historias")
+        _commit_em_lotes(db, [
+            (col.document(h), {"status": novo_status, "atualizado_em": firestore.SERVER_TIMESTAMP}, "update")
+            for h in historia_ids
+        ])
         return True
     except: return False
+
+# --- CONSULTAS DA BIBLIOTECA ---
+CAMPOS_LISTAGEM = ["tema", "nicho", "status", "generos", "data_criacao"]
+
+def listar_historias(status=None, limite=20, cursor=None):
+    """
+    Lista uma página de histórias só com os campos leves (projeção no servidor).
+    `cursor` é (data_criacao, id) do último item da página anterior — o id desempata
+    histórias salvas no mesmo instante (lote concorrente), que senão sumiriam na virada da página.
+    Retorna (itens, proximo_cursor) — proximo_cursor é None na última página.
+    """
+    db = firestore.client()
+    query = db.collection("historias")
+    if status and status != "Todos":
+        query = query.where(filter=firestore.FieldFilter("status", "==", status))
+    query = query.order_by("data_criacao", direction=firestore.Query.DESCENDING)
+    query = query.order_by("__name__", direction=firestore.Query.DESCENDING)
+    query = query.select(CAMPOS_LISTAGEM)
+    if cursor is not None:
+        data_criacao, doc_id = cursor
+        query = query.start_after({"data_criacao": data_criacao, "__name__": doc_id})
+    docs = list(query.limit(limite + 1).stream())
+
+    itens = []
+    for doc in docs[:limite]:
+        dado = doc.to_dict()
+        dado['id'] = doc.id
+        itens.append(dado)
+    proximo = (itens[-1].get('data_criacao'), itens[-1]['id']) if len(docs) > limite else None
+    return itens, proximo
+
+def carregar_historia_completa(historia_id):
+    """Baixa o documento inteiro (roteiros e prompts) de uma história."""
+    try:
+        db = firestore.client()
+        doc = db.collection("historias").document(historia_id).get()
+        if not doc.exists: return None
+        dado = doc.to_dict()
+        dado['id'] = doc.id
+        if dado.get("layout") == LAYOUT_CAPITULOS:
+            dado = _montar_historia(dado, carregar_capitulos(historia_id))
+        return dado
+    except Exception as e:
+        st.error(f"Erro ao abrir história: {e}")
+        return None